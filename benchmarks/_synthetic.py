@@ -0,0 +1,70 @@
+"""
+Generates and imports a synthetic module with many containers and injected functions, for benchmarks.
+The module is written to a temporary directory, since rewrite_ast needs the functions' source code.
+"""
+import random
+import sys
+import tempfile
+from os import path
+
+_TEMPLATE_HEADER = '''import attr
+from roro_ioc import create_ioc_container, inject, INJECTED
+'''
+
+_TEMPLATE_CONTAINER = '''
+
+@attr.attrs
+class Payload{index}(object):
+{fields}
+
+
+CONTAINER_{index} = create_ioc_container(Payload{index})
+'''
+
+_TEMPLATE_FUNCTION = '''
+
+@inject(CONTAINER_{container_index})
+def function_{index}(value, {arguments}):
+    return value
+'''
+
+
+def field_name(container_index, field_index):
+    return 'c{}_f{}'.format(container_index, field_index)
+
+
+def generate_source(containers, fields_per_container, functions, arguments_per_function, seed=0):
+    generator = random.Random(seed)
+    parts = [_TEMPLATE_HEADER]
+    for index in xrange(containers):
+        parts.append(_TEMPLATE_CONTAINER.format(
+            index=index,
+            fields='\n'.join('    {} = attr.attrib()'.format(field_name(index, field_index))
+                             for field_index in xrange(fields_per_container))))
+    for index in xrange(functions):
+        container_index = index % containers  # function_i is injected from CONTAINER_{i % containers}
+        field_indices = generator.sample(xrange(fields_per_container),
+                                         min(arguments_per_function, fields_per_container))
+        parts.append(_TEMPLATE_FUNCTION.format(
+            index=index,
+            container_index=container_index,
+            arguments=', '.join('{}=INJECTED'.format(field_name(container_index, field_index))
+                                for field_index in field_indices)))
+    return ''.join(parts)
+
+
+def import_synthetic_module(containers, fields_per_container, functions, arguments_per_function,
+                            module_name='_roro_ioc_synthetic'):
+    directory = tempfile.mkdtemp(prefix='roro_ioc_benchmark')
+    with open(path.join(directory, module_name + '.py'), 'w') as module_file:
+        module_file.write(generate_source(containers, fields_per_container, functions, arguments_per_function))
+    sys.path.insert(0, directory)
+    try:
+        return __import__(module_name)
+    finally:
+        sys.path.remove(directory)
+
+
+def make_payload(module, container_index, fields_per_container):
+    payload_type = getattr(module, 'Payload{}'.format(container_index))
+    return payload_type(*xrange(fields_per_container))
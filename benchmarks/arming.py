@@ -0,0 +1,104 @@
+"""
+Measures the cost of arming and disarming containers.
+
+    python -m benchmarks.arming --containers 6 --fields 10 --declared-fields 60
+
+The last lines arm a container of --declared-fields fields with arm_used_resources_only, while a varying number of
+them is read by a decorated function: its cost should follow the fields used rather than those declared.
+"""
+import argparse
+from contextlib import nested
+from timeit import repeat
+
+import attr
+
+from roro_ioc import arm_all, create_ioc_container, ArmedAccounting, inject, INJECTED
+
+
+def _create(containers, fields, accounting=None):
+    result = []
+    for index in xrange(containers):
+        payload_type = attr.make_class('Payload{}'.format(index),
+                                       ['c{}_f{}'.format(index, field) for field in xrange(fields)])
+        result.append((create_ioc_container(payload_type, accounting=accounting), payload_type(*xrange(fields))))
+    return result
+
+
+def _measure(function, number):
+    return min(repeat(function, number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--containers', type=int, default=6)
+    parser.add_argument('--fields', type=int, default=10)
+    parser.add_argument('--declared-fields', type=int, default=60)
+    parser.add_argument('--number', type=int, default=20000)
+    arguments = parser.parse_args()
+
+    containers_and_payloads = _create(arguments.containers, arguments.fields)
+    payloads = dict(containers_and_payloads)
+
+    def nested_arm():
+        with nested(*(container.arm(payload) for (container, payload) in containers_and_payloads)):
+            pass
+
+    def all_at_once():
+        with arm_all(payloads):
+            pass
+
+    print('{} containers of {} fields'.format(arguments.containers, arguments.fields))
+    print('nested arm():  {:.2f}us'.format(1e6 * _measure(nested_arm, arguments.number)))
+    print('arm_all():     {:.2f}us'.format(1e6 * _measure(all_at_once, arguments.number)))
+
+    ((container, payload),) = _create(1, arguments.fields)
+    ((accounted_container, accounted_payload),) = _create(1, arguments.fields,
+                                                          ArmedAccounting(lambda payload: 'label'))
+
+    def single_arm():
+        with container.arm(payload):
+            pass
+
+    def accounted_arm():
+        with accounted_container.arm(accounted_payload):
+            pass
+
+    print('single arm() without accounting: {:.2f}us'.format(1e6 * _measure(single_arm, arguments.number)))
+    print('single arm() with accounting:    {:.2f}us'.format(1e6 * _measure(accounted_arm, arguments.number)))
+
+    print('{} declared fields:'.format(arguments.declared_fields))
+    for used in sorted({1, 10, arguments.declared_fields // 2, arguments.declared_fields}):
+        print('  {:>3} used, arm():                {:.2f}us'.format(
+            used, 1e6 * _measure(_used_fields_arm(arguments.declared_fields, used), arguments.number)))
+    ((wide_container, wide_payload),) = _create(1, arguments.declared_fields)
+
+    def wide_arm():
+        with wide_container.arm(wide_payload):
+            pass
+
+    print('  without arm_used_resources_only: {:.2f}us'.format(1e6 * _measure(wide_arm, arguments.number)))
+
+
+def _used_fields_arm(declared, used):
+    payload_type = attr.make_class('Wide{}'.format(used), ['f{}'.format(field) for field in xrange(declared)])
+    container = create_ioc_container(payload_type, arm_used_resources_only=True)
+    inject(container)(_read_fields(used))
+    payload = payload_type(*xrange(declared))
+
+    def arm():
+        with container.arm(payload):
+            pass
+
+    return arm
+
+
+def _read_fields(used):
+    # A function reading the first used fields; only which fields are injected matters, not the engine
+    arguments = ', '.join('f{}=INJECTED'.format(field) for field in xrange(used))
+    namespace = {'INJECTED': INJECTED}
+    exec 'def read({}):\n    pass\n'.format(arguments) in namespace
+    return namespace['read']
+
+
+if __name__ == '__main__':
+    main()
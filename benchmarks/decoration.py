@@ -0,0 +1,36 @@
+"""
+Measures the time spent decorating injected functions, as reported to decoration listeners (see roro_ioc.audit).
+Functions are generated in a single module, so later ones sit deeper in the file.
+
+    python -m benchmarks.decoration --functions 2000
+"""
+import argparse
+
+from roro_ioc.inject import add_decoration_listener
+
+from benchmarks._synthetic import import_synthetic_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--containers', type=int, default=20)
+    parser.add_argument('--fields', type=int, default=10)
+    parser.add_argument('--functions', type=int, default=2000)
+    parser.add_argument('--arguments', type=int, default=3)
+    arguments = parser.parse_args()
+
+    records = []
+    add_decoration_listener(records.append)
+    import_synthetic_module(arguments.containers, arguments.fields, arguments.functions, arguments.arguments)
+
+    durations = sorted(record.decoration_seconds for record in records)
+    first_tenth = [record.decoration_seconds for record in records[:len(records) // 10]]
+    last_tenth = [record.decoration_seconds for record in records[-(len(records) // 10):]]
+    print('{} functions decorated in {:.3f}s'.format(len(records), sum(durations)))
+    print('median:        {:.1f}us'.format(1e6 * durations[len(durations) // 2]))
+    print('first tenth:   {:.1f}us mean'.format(1e6 * sum(first_tenth) / len(first_tenth)))
+    print('last tenth:    {:.1f}us mean'.format(1e6 * sum(last_tenth) / len(last_tenth)))
+
+
+if __name__ == '__main__':
+    main()
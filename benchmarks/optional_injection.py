@@ -0,0 +1,66 @@
+"""
+Measures calls injecting INJECTED_IF_AVAILABLE arguments, with and without their container armed.
+
+    python -m benchmarks.optional_injection --number 200000
+
+Unarmed calls take the fallback branch, which should cost about as much as the armed one on every engine.
+"""
+import argparse
+from importlib import import_module
+from timeit import repeat
+
+import attr
+
+from roro_ioc import create_ioc_container, inject, INJECTED_IF_AVAILABLE, injected_if_available
+from roro_ioc.inject import add_decoration_listener, remove_decoration_listener
+
+# roro_ioc re-exports the inject function under the module's name
+inject_module = import_module('roro_ioc.inject')
+
+
+@attr.attrs
+class OptionalPayload(object):
+    cache = attr.attrib()
+    tenant = attr.attrib()
+
+
+CONTAINER = create_ioc_container(OptionalPayload)
+NULL_CACHE = object()
+
+
+def _define():
+    @inject(CONTAINER)
+    def function(cache=injected_if_available(NULL_CACHE), tenant=INJECTED_IF_AVAILABLE):
+        return cache, tenant
+
+    return function
+
+
+def _measure(function, number):
+    return min(repeat(function, number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=200000)
+    arguments = parser.parse_args()
+
+    records = []
+    original_use_wrapping_injector = inject_module._USE_WRAPPING_INJECTOR
+    for use_wrapping_injector in (False, True):
+        inject_module._USE_WRAPPING_INJECTOR = use_wrapping_injector
+        add_decoration_listener(records.append)
+        try:
+            function = _define()
+        finally:
+            remove_decoration_listener(records.append)
+            inject_module._USE_WRAPPING_INJECTOR = original_use_wrapping_injector
+        engine = records[-1].engine
+        unarmed = _measure(function, arguments.number)
+        with CONTAINER.arm(OptionalPayload('cache', 'tenant')):
+            armed = _measure(function, arguments.number)
+        print('{:<12} armed: {:.3f}us  not armed: {:.3f}us'.format(engine, 1e6 * armed, 1e6 * unarmed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Measures per-worker unique memory (USS) of a prefork server using roro_ioc.
+
+The parent imports a synthetic module with many containers and injected functions, optionally calls
+prepare_for_fork(), then forks workers which serve synthetic requests. Each worker reports the memory it does not
+share with anybody else, read from /proc/self/smaps (Linux only).
+
+    python -m benchmarks.prefork_memory --workers 4 --containers 200 --functions 2000
+    python -m benchmarks.prefork_memory --workers 4 --containers 200 --functions 2000 --no-prepare
+"""
+import argparse
+import os
+import random
+
+from roro_ioc import prepare_for_fork
+
+from benchmarks._synthetic import import_synthetic_module, make_payload
+
+
+def unique_memory_kb():
+    result = 0
+    with open('/proc/self/smaps') as smaps:
+        for line in smaps:
+            if line.startswith('Private_Clean:') or line.startswith('Private_Dirty:'):
+                result += int(line.split()[1])
+    return result
+
+
+def serve(module, arguments):
+    generator = random.Random(os.getpid())
+    for _ in xrange(arguments.requests):
+        container_index = generator.randrange(arguments.containers)
+        container = getattr(module, 'CONTAINER_{}'.format(container_index))
+        with container.arm(make_payload(module, container_index, arguments.fields)):
+            for function_index in xrange(0, arguments.functions, max(1, arguments.functions // 100)):
+                function = getattr(module, 'function_{}'.format(function_index))
+                try:
+                    function(0)
+                except ValueError:  # Injected from a container which is not armed
+                    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--containers', type=int, default=200)
+    parser.add_argument('--fields', type=int, default=20)
+    parser.add_argument('--functions', type=int, default=2000)
+    parser.add_argument('--arguments', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--no-prepare', action='store_true', help='Do not call prepare_for_fork() before forking')
+    arguments = parser.parse_args()
+
+    module = import_synthetic_module(arguments.containers, arguments.fields, arguments.functions,
+                                     arguments.arguments)
+    if not arguments.no_prepare:
+        prepare_for_fork()
+    print('parent: {} kB unique'.format(unique_memory_kb()))
+
+    workers = []
+    for _ in xrange(arguments.workers):
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            serve(module, arguments)
+            os.write(write_end, str(unique_memory_kb()))
+            os._exit(0)
+        os.close(write_end)
+        workers.append((pid, read_end))
+
+    for (pid, read_end) in workers:
+        os.waitpid(pid, 0)
+        print('worker {}: {} kB unique'.format(pid, os.read(read_end, 64)))
+        os.close(read_end)
+
+
+if __name__ == '__main__':
+    main()
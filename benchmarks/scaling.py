@@ -0,0 +1,58 @@
+"""
+Measures how roro_ioc scales with the number of containers and injected functions: time to import (create and
+decorate) them, resident memory they add, and the latency of an injected call.
+
+    python -m benchmarks.scaling --containers 10000 --functions 50000
+
+Run one size per process, so memory figures are not polluted by previous runs.
+"""
+import argparse
+import gc
+from timeit import default_timer, repeat
+
+from benchmarks._synthetic import import_synthetic_module, make_payload
+
+
+def rss_kb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--containers', type=int, default=1000)
+    parser.add_argument('--fields', type=int, default=10)
+    parser.add_argument('--functions', type=int, default=5000)
+    parser.add_argument('--arguments', type=int, default=3)
+    parser.add_argument('--calls', type=int, default=100000)
+    arguments = parser.parse_args()
+
+    gc.collect()
+    rss_before = rss_kb()
+    start = default_timer()
+    module = import_synthetic_module(arguments.containers, arguments.fields, arguments.functions,
+                                     arguments.arguments)
+    import_seconds = default_timer() - start
+    gc.collect()
+    rss_delta = rss_kb() - rss_before
+
+    call_seconds = float('nan')
+    if arguments.functions:
+        function = module.function_0  # Injected from CONTAINER_0
+        with module.CONTAINER_0.arm(make_payload(module, 0, arguments.fields)):
+            call_seconds = min(repeat(lambda: function(0), number=arguments.calls, repeat=3)) / arguments.calls
+
+    per_unit = max(1, arguments.containers + arguments.functions)
+    print('containers={} functions={}'.format(arguments.containers, arguments.functions))
+    print('import:          {:.3f}s ({:.1f}us per container or function)'.format(
+        import_seconds, 1e6 * import_seconds / per_unit))
+    print('rss:             {:.1f}MB ({:.2f}kB per container or function)'.format(
+        rss_delta / 1024.0, float(rss_delta) / per_unit))
+    print('injected call:   {:.0f}ns'.format(1e9 * call_seconds))
+
+
+if __name__ == '__main__':
+    main()
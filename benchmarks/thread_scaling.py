@@ -0,0 +1,57 @@
+"""
+Measures injected call throughput with 1 to 64 threads, each arming its own payload.
+
+With no shared state on the call path, per-thread throughput should stay flat on free-threaded builds, and total
+throughput should stay flat (rather than collapse) under the GIL.
+
+    python -m benchmarks.thread_scaling --calls 100000
+"""
+import argparse
+import sys
+import threading
+from timeit import default_timer
+
+from benchmarks._synthetic import import_synthetic_module, make_payload
+
+_THREAD_COUNTS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def run(module, thread_count, calls, fields):
+    function = module.function_0
+    barrier = threading.Event()
+
+    def work():
+        with module.CONTAINER_0.arm(make_payload(module, 0, fields)):
+            barrier.wait()
+            for _ in xrange(calls):
+                function(0)
+
+    threads = [threading.Thread(target=work) for _ in xrange(thread_count)]
+    for thread in threads:
+        thread.start()
+    start = default_timer()
+    barrier.set()
+    for thread in threads:
+        thread.join()
+    return default_timer() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=100000, help='Injected calls per thread')
+    parser.add_argument('--fields', type=int, default=10)
+    parser.add_argument('--arguments', type=int, default=3)
+    arguments = parser.parse_args()
+
+    module = import_synthetic_module(1, arguments.fields, 1, arguments.arguments)
+    gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print('{} (GIL {})'.format(sys.version.split()[0], 'enabled' if gil_enabled else 'disabled'))
+    print('{:>8} {:>12} {:>16} {:>16}'.format('threads', 'seconds', 'calls/s total', 'calls/s/thread'))
+    for thread_count in _THREAD_COUNTS:
+        elapsed = run(module, thread_count, arguments.calls, arguments.fields)
+        total = thread_count * arguments.calls / elapsed
+        print('{:>8} {:>12.3f} {:>16.0f} {:>16.0f}'.format(thread_count, elapsed, total, total / thread_count))
+
+
+if __name__ == '__main__':
+    main()
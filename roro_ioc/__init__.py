@@ -1,8 +1,14 @@
+from roro_ioc.accounting import ArmedAccounting, UsageTable
 from roro_ioc.container import IOCContainer
 from roro_ioc.exceptions import NoSourceForArgument, NoValuesProvided
 from roro_ioc.inject import (inject,
                              inject_,
                              inject_methods,
                              inject_methods_)
-from roro_ioc.injected_tag import INJECTED, INJECTED_IF_AVAILABLE
-from roro_ioc.instance_ioc_container import create_ioc_container
+from roro_ioc.injected_tag import INJECTED, INJECTED_IF_AVAILABLE, injected_if_available
+from roro_ioc.instance_ioc_container import create_ioc_container, arm_all
+from roro_ioc.prefork import prepare_for_fork, reset_after_fork
+from roro_ioc.schema_ioc_container import (create_schema_ioc_container,
+                                           MAPPING_PAYLOAD,
+                                           SEQUENCE_PAYLOAD,
+                                           ATTRIBUTES_PAYLOAD)
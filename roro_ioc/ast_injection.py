@@ -1,11 +1,13 @@
 import inspect
-from ast import parse, NodeTransformer, copy_location, Attribute, Name, Load, Is, Store, Assign, Compare, If, \
-    FunctionDef, arguments, fix_missing_locations, Param, Subscript, Index, Num, Str, Expr, Call
-from functools import partial
+from ast import parse, copy_location, Attribute, Name, Load, Is, Store, Assign, Compare, If, \
+    FunctionDef, arguments, fix_missing_locations, Param, Subscript, Index, Num, Str, Expr, Call, Module, Return, walk, \
+    keyword
+from functools import update_wrapper, WRAPPER_ASSIGNMENTS
 from itertools import takewhile
 from logging import getLogger
+from types import CodeType
 
-from typing import Callable, Tuple, Any, Dict, List, Union
+from typing import Callable, Tuple, Any, Dict, List, Union, Optional, Iterator, FrozenSet
 
 from roro_ioc.container import IOCContainer
 from roro_ioc.container_field_registry import get_fast_retrieval_context, get_fast_retrieval_resource_handle
@@ -18,15 +20,20 @@ class SourceCodeInaccessibleError(ValueError):
 
 
 def _get_source(callable_arg):
-    source = inspect.getsource(callable_arg)
+    # type: (Callable) -> Module
+    """
+    Parses only the callable's own source. Line numbers are those of the source, not of the original file; see
+    _prepare_function_ast.
+    """
+    try:
+        source = inspect.getsource(callable_arg)
+    except (IOError, TypeError) as e:
+        raise SourceCodeInaccessibleError('Could not retrieve source code for {}: {}'.format(callable_arg, e))
 
     start_indent = ''.join(takewhile(lambda l: l.isspace(), source))
     len_start_indent = len(start_indent)
 
-    first_line_no = callable_arg.func_code.co_firstlineno
-
-    source_stripped_prefix = ('\n' * (first_line_no - 1)) + \
-                             ('\n'.join(line[len_start_indent:] for line in source.split('\n')))
+    source_stripped_prefix = '\n'.join(line[len_start_indent:] for line in source.split('\n'))
 
     try:
         return parse(source_stripped_prefix)
@@ -35,142 +42,275 @@ def _get_source(callable_arg):
             callable_arg, source))
 
 
-class _ManglePrivateMembers(NodeTransformer):
-    def __init__(self, class_name):
-        self.class_name = class_name
-
-    # noinspection PyPep8Naming
-    def visit_Attribute(self, node):
-        # Make sure descendants of this node are visited too
-        self.generic_visit(node)
-
-        attribute_name = node.attr
-        if self._should_mangle(attribute_name):
-            mangled_name = self._get_mangled_name(attribute_name)
-            return copy_location(
-                Attribute(value=node.value, attr=mangled_name, ctx=node.ctx),
-                node
-            )
+def _code_names(code):
+    # type: (CodeType) -> Iterator[basestring]
+    # Attribute names used by code and the functions, lambdas and classes nested in it
+    for name in code.co_names:
+        yield name
+    for constant in code.co_consts:
+        if isinstance(constant, CodeType):
+            for name in _code_names(constant):
+                yield name
+
+
+def _is_private(attribute_name):
+    return attribute_name.startswith('__') and not attribute_name.endswith('__')
+
+
+def _prepare_function_ast(ast_structure, line_offset):
+    # type: (Module, int) -> List[Attribute]
+    """
+    The single pass over the parsed function: moves every node to its line in the original file (as
+    ast.increment_lineno does) and collects the attributes which the compiler may have mangled, see _mangle.
+    """
+    private_attributes = []
+    for node in walk(ast_structure):
+        if 'lineno' in node._attributes and hasattr(node, 'lineno'):
+            node.lineno += line_offset
+        if isinstance(node, Attribute) and _is_private(node.attr):
+            private_attributes.append(node)
+    return private_attributes
+
+
+def _mangle(private_attributes, original_code):
+    # type: (List[Attribute], CodeType) -> None
+    """
+    Code compiled in a class body has its private attributes mangled (self.__x becomes self._Class__x). The
+    rewritten function is compiled outside of any class, so it has to be mangled by hand. Rather than finding out
+    which class the function was defined in, the mangled names are read back from the original code: every private
+    attribute was mangled with the same prefix, so it is the prefix which can explain all of them.
+    """
+    if not private_attributes:
+        return
+
+    names = frozenset(_code_names(original_code))
+    candidate_prefixes = None
+    for attribute_name in frozenset(node.attr for node in private_attributes):
+        prefixes = frozenset(name[:-len(attribute_name)] for name in names
+                             if name.endswith(attribute_name) and
+                             (name == attribute_name or (name.startswith('_') and name[1:2] != '_')))
+        candidate_prefixes = prefixes if candidate_prefixes is None else candidate_prefixes & prefixes
+
+    if not candidate_prefixes:
+        return
+    prefix = max(candidate_prefixes, key=len)
+    if prefix:
+        for node in private_attributes:
+            node.attr = prefix + node.attr
+
+
+_INTERNAL_CONTEXT_NAME = '___INJECT_CONTEXT_INTERNAL'
+_INTERNAL_RESOURCES_NAME = '___INJECT_CONTEXT_INTERNAL_RESOURCES'
+_INTERNAL_TARGET_NAME = '___INJECT_TARGET_INTERNAL'
+_INTERNAL_DEFAULTS_NAME = '___INJECT_DEFAULTS_INTERNAL'
+
+
+def _generate_prologue(parameters, default_nodes_mapping, location):
+    # type: (Tuple[Tuple[basestring, Tuple[int, ...], bool], ...], Dict[basestring, Any], Dict[basestring, int]) -> List[Union[Assign, If]]
+    """
+    We have a function that looks like:
+    def do_something(param, model_=INJECTED):
+        <...>
+
+    We insert into its beginning a statement like
+        ___INJECT_CONTEXT_INTERNAL_RESOURCES = ___INJECT_CONTEXT_INTERNAL.resources
+        if model_ is INJECTED:
+            model_ = ___INJECT_CONTEXT_INTERNAL_RESOURCES[3]
+            if model is ___INJECT_CONTEXT_INTERNAL:    # means that no resource is available
+                ___INJECT_CONTEXT_INTERNAL.flag_missing('model_')
+
+    A resource provided by a container and its ancestors is read from each of their slots in turn, the nearest
+    container first, until one is armed:
+            if model_ is ___INJECT_CONTEXT_INTERNAL:
+                model_ = ___INJECT_CONTEXT_INTERNAL_RESOURCES[0]
+                if model_ is ___INJECT_CONTEXT_INTERNAL:
+                    ___INJECT_CONTEXT_INTERNAL.flag_missing('model_')
+
+    Optional arguments (see InjectedTag) fall back to the default of their tag instead, with no exception involved:
+            if model_ is ___INJECT_CONTEXT_INTERNAL:
+                model_ = INJECTED_IF_AVAILABLE.default
+
+    parameters holds (argument_name, resource_handles, is_optional) per injected argument, and default_nodes_mapping
+    the expression its default value is compared with.
+    Every generated node is created at location (lineno and col_offset), so no fix_missing_locations pass is needed.
+    """
+    at = location
+
+    def _generate_assignment((arg_name, arg_resource_handles, is_optional)):
+        # type: (Tuple[basestring, Tuple[int, ...], bool]) -> If
+        if is_optional:
+            when_missing = [Assign(targets=[Name(id=arg_name, ctx=Store(), **at)],
+                                   value=Attribute(value=default_nodes_mapping[arg_name], attr='default', ctx=Load(),
+                                                   **at), **at)]  # type: List[Union[Assign, If, Expr]]
         else:
-            return node
-
-    def _should_mangle(self, attribute_name):
-        return attribute_name.startswith('__') and (not attribute_name.endswith('__')) and self.class_name
-
-    def _get_mangled_name(self, attribute_name):
-        mangled_class_name = '_{}'.format(self.class_name.lstrip('_'))
-        mangled_name = '{}{}'.format(mangled_class_name, attribute_name)
-        return mangled_name
-
-
-class _InjectParameters(NodeTransformer):
-    def __init__(self, parameters, default_argument_name):
-        self.parameters = parameters  # type: Tuple[Tuple[basestring, int], ...]
-        self.injected_arguments_set = frozenset(parameter[0] for parameter in self.parameters)
-        # Schema: (argument_name, resource_name, resource_handle)
-        self.default_argument_name = default_argument_name  # type: basestring
-
-    # noinspection PyPep8Naming
-    def visit_FunctionDef(self, node):
-        function_name = node.name
-
-        INTERNAL_CONTEXT_NAME = '___INJECT_CONTEXT_INTERNAL'
-        INTERNAL_RESOURCES_NAME = '___INJECT_CONTEXT_INTERNAL_RESOURCES'
-
-        last_existing_arg = node.args.args[-1]  # non-empty because we inject somewhere
-        new_args = node.args.args + [copy_location(Name(id=INTERNAL_CONTEXT_NAME, ctx=Param()), last_existing_arg)]
-
-        last_existing_default = node.args.defaults[-1]
-        new_defaults = node.args.defaults + [copy_location(Name(id=self.default_argument_name, ctx=Load()),
-                                                           last_existing_default)]
-
-        # Format: (Name(id='a', ctx=Param()), Name(id='foo', ctx=Load()))
-        def generate_default_nodes():
-            for (argument, default_value) in zip(node.args.args[-len(node.args.defaults):], node.args.defaults):
-                if argument.id in self.injected_arguments_set:
-                    yield (argument.id, default_value)
-
-        default_nodes_mapping = dict(generate_default_nodes())
-
-        def _generate_assignment((arg_name, arg_resource_handle)):
-            # type: (Tuple[basestring, int]) -> If
-            """
-            We have a function that looks like:
-            def do_something(param, model_=INJECTED):
-                <...>
-
-            We insert into its beginning a statement like
-                ___INJECT_CONTEXT_INTERNAL_RESOURCES = ___INJECT_CONTEXT_INTERNAL.resources
-                if model_ is INJECTED:
-                    model_ = ___INJECT_CONTEXT_INTERNAL_RESOURCES[3]
-                    if model is ___INJECT_CONTEXT_INTERNAL:    # means that no resource is available
-                        ___INJECT_CONTEXT_INTERNAL_RESOURCES.flag_missing('model_')
-
-            Code outside of this function sets a global variable _INJECTED__model to point at the right thing.
-            """
-            target_attribute = Subscript(value=Name(id=INTERNAL_RESOURCES_NAME, ctx=Load()),
-                                         slice=Index(value=Num(n=arg_resource_handle)), ctx=Load())
-
-            consequence = [
-                Assign(targets=[Name(id=arg_name, ctx=Store())],
-                       value=target_attribute),
-                If(test=Compare(left=Name(id=arg_name, ctx=Load()), ops=[Is()],
-                                comparators=[Name(id=INTERNAL_CONTEXT_NAME, ctx=Load())]),
-                   body=[Expr(value=Call(func=Attribute(value=Name(id=INTERNAL_CONTEXT_NAME, ctx=Load()),
-                                                        attr='flag_missing', ctx=Load()),
-                                         keywords=[],
-                                         starargs=None,
-                                         kwargs=None,
-                                         args=[Str(s=arg_name)]))],
-                   orelse=[])
-            ]  # type: List[Union[Assign, If]
-
-            return If(test=Compare(left=Name(id=arg_name, ctx=Load()), ops=[Is()],
-                                   comparators=[default_nodes_mapping[arg_name]]),
-                      body=consequence,
-                      orelse=[])
-
-        first_body_element = node.body[0]
-        align_with_first_body_element = partial(copy_location, old_node=first_body_element)
-
-        new_body = [align_with_first_body_element(
-            Assign(targets=[Name(id=INTERNAL_RESOURCES_NAME, ctx=Store())],
-                   value=Attribute(value=Name(id=INTERNAL_CONTEXT_NAME,
-                                              ctx=Load()), attr='resources', ctx=Load())))]
-
-        new_body.extend(map(align_with_first_body_element, map(_generate_assignment, self.parameters)))
-        new_body.extend(node.body)
-
-        result = copy_location(
-            FunctionDef(name=function_name,
-                        args=arguments(
-                            args=new_args,
-                            vararg=node.args.vararg,
-                            kwarg=node.args.kwarg,
-                            defaults=new_defaults),
-                        body=new_body,
-                        decorator_list=[]),  # Note that no decorators are applied, as @inject has to be the first
-            node
-        )
-        return result
-
-
-def rewrite_ast(type_or_callable, class_name, injectable_arguments_tuple, arg_to_ioc_container):
-    # type: (Callable, basestring, Tuple[Tuple[basestring, basestring, Any], ...], Dict[basestring, IOCContainer])
+            when_missing = [Expr(value=Call(func=Attribute(value=Name(id=_INTERNAL_CONTEXT_NAME, ctx=Load(), **at),
+                                                           attr='flag_missing', ctx=Load(), **at),
+                                            keywords=[],
+                                            starargs=None,
+                                            kwargs=None,
+                                            args=[Str(s=arg_name, **at)], **at), **at)]
+
+        # Built from the farthest ancestor inwards, each slot read only running when the previous ones were empty
+        for arg_resource_handle in reversed(arg_resource_handles):
+            target_attribute = Subscript(value=Name(id=_INTERNAL_RESOURCES_NAME, ctx=Load(), **at),
+                                         slice=Index(value=Num(n=arg_resource_handle, **at)), ctx=Load(), **at)
+            when_missing = [
+                Assign(targets=[Name(id=arg_name, ctx=Store(), **at)],
+                       value=target_attribute, **at),
+                If(test=Compare(left=Name(id=arg_name, ctx=Load(), **at), ops=[Is()],
+                                comparators=[Name(id=_INTERNAL_CONTEXT_NAME, ctx=Load(), **at)], **at),
+                   body=when_missing,
+                   orelse=[], **at)
+            ]
+
+        return If(test=Compare(left=Name(id=arg_name, ctx=Load(), **at), ops=[Is()],
+                               comparators=[default_nodes_mapping[arg_name]], **at),
+                  body=when_missing,
+                  orelse=[], **at)
+
+    prologue = [Assign(targets=[Name(id=_INTERNAL_RESOURCES_NAME, ctx=Store(), **at)],
+                       value=Attribute(value=Name(id=_INTERNAL_CONTEXT_NAME,
+                                                  ctx=Load(), **at), attr='resources', ctx=Load(), **at), **at)]
+    prologue.extend(map(_generate_assignment, parameters))
+    return prologue
+
+
+def _injected_arguments(injectable_arguments_tuple, optional_arguments, arg_to_ioc_containers):
+    # type: (Tuple[Tuple[basestring, basestring, Any], ...], FrozenSet[basestring], Dict[basestring, Tuple[IOCContainer, ...]]) -> Tuple[Tuple[basestring, Tuple[int, ...], bool], ...]
+    return tuple((argument_name,
+                  tuple(get_fast_retrieval_resource_handle(ioc_container, resource_name)
+                        for ioc_container in arg_to_ioc_containers[resource_name]),
+                  argument_name in optional_arguments)
+                 for (argument_name, resource_name, _) in injectable_arguments_tuple)
+
+
+def _inject_parameters(node, parameters, default_argument_name, defaults_argument_name, default_values):
+    # type: (FunctionDef, Tuple[Tuple[basestring, Tuple[int, ...], bool], ...], basestring, basestring, Tuple[Any, ...]) -> Tuple[FunctionDef, Tuple[Any, ...]]
+    """
+    Returns, along with the default values of the injected arguments, node with the injection prologue (see _generate_prologue) and the fast retrieval context argument added.
+    Only the nodes created here get locations assigned; the function's own nodes already have theirs.
+
+    Injected arguments get their default values from a tuple held by another hidden argument, which the prologue
+    compares them with: their default expressions are neither evaluated again at definition time nor at call time.
+    """
+    injected_arguments_set = frozenset(parameter[0] for parameter in parameters)
+
+    last_existing_arg = node.args.args[-1]  # non-empty because we inject somewhere
+    new_args = node.args.args + [copy_location(Name(id=_INTERNAL_CONTEXT_NAME, ctx=Param()), last_existing_arg),
+                                 copy_location(Name(id=_INTERNAL_DEFAULTS_NAME, ctx=Param()), last_existing_arg)]
+
+    # Format: (Name(id='a', ctx=Param()), Name(id='foo', ctx=Load()))
+    default_nodes_mapping = {}
+    defaults_values = []
+    new_defaults = []
+    for (argument, default_node, default_value) in zip(node.args.args[-len(node.args.defaults):],
+                                                       node.args.defaults,
+                                                       default_values):
+        if isinstance(argument, Name) and argument.id in injected_arguments_set:
+            at = {'lineno': default_node.lineno, 'col_offset': default_node.col_offset}
+            index = Index(value=Num(n=len(defaults_values), **at))
+            default_node = Subscript(value=Name(id=defaults_argument_name, ctx=Load(), **at), slice=index,
+                                     ctx=Load(), **at)
+            default_nodes_mapping[argument.id] = Subscript(value=Name(id=_INTERNAL_DEFAULTS_NAME, ctx=Load(), **at),
+                                                           slice=index, ctx=Load(), **at)
+            defaults_values.append(default_value)
+        new_defaults.append(default_node)
+
+    last_existing_default = node.args.defaults[-1]
+    new_defaults.extend((copy_location(Name(id=default_argument_name, ctx=Load()), last_existing_default),
+                         copy_location(Name(id=defaults_argument_name, ctx=Load()), last_existing_default)))
+
+    first_body_element = node.body[0]
+    new_body = _generate_prologue(parameters, default_nodes_mapping,
+                                  {'lineno': first_body_element.lineno, 'col_offset': first_body_element.col_offset})
+    new_body.extend(node.body)
+
+    return copy_location(
+        FunctionDef(name=node.name,
+                    args=arguments(
+                        args=new_args,
+                        vararg=node.args.vararg,
+                        kwarg=node.args.kwarg,
+                        defaults=new_defaults),
+                    body=new_body,
+                    decorator_list=[]),  # Note that no decorators are applied, as @inject has to be the first
+        node
+    ), tuple(defaults_values)
+
+
+def rewrite_ast(type_or_callable, injectable_arguments_tuple, optional_arguments, arg_to_ioc_containers):
+    # type: (Callable, Tuple[Tuple[basestring, basestring, Any], ...], FrozenSet[basestring], Dict[basestring, Tuple[IOCContainer, ...]])
     globals_dict = type_or_callable.func_globals
+    original_code = type_or_callable.func_code
     ast_structure = _get_source(type_or_callable)
-    function_name = ast_structure.body[0].name
+    _mangle(_prepare_function_ast(ast_structure, original_code.co_firstlineno - 1), original_code)
 
-    injected_arguments = tuple((argument_name,
-                                get_fast_retrieval_resource_handle(arg_to_ioc_container[resource_name], resource_name))
-                               for (argument_name, resource_name, _) in injectable_arguments_tuple)
+    injected_arguments = _injected_arguments(injectable_arguments_tuple, optional_arguments, arg_to_ioc_containers)
     default_value_name = '__INJECT___FAST_RETRIEVAL_CONTEXT'
-    _InjectParameters(injected_arguments, default_value_name).visit(ast_structure)
-    _ManglePrivateMembers(class_name).visit(ast_structure)
-    fix_missing_locations(ast_structure)
+    defaults_value_name = '__INJECT___DEFAULTS'
+    function_def, injected_defaults = _inject_parameters(ast_structure.body[0], injected_arguments, default_value_name,
+                                                         defaults_value_name, type_or_callable.func_defaults)
+    ast_structure.body[0] = function_def
 
-    locals_dict = {default_value_name: get_fast_retrieval_context()}
-    eval(compile(ast_structure, filename=inspect.getfile(type_or_callable), mode="exec"),
+    locals_dict = {default_value_name: get_fast_retrieval_context(), defaults_value_name: injected_defaults}
+    eval(compile(ast_structure, filename=original_code.co_filename, mode="exec"),
          globals_dict, locals_dict)
 
-    return locals_dict.get(function_name)
+    return locals_dict.get(function_def.name)
+
+
+def build_injecting_shim(target, argument_names, argument_default_values, vararg, kwarg,
+                         injectable_arguments_tuple, optional_arguments, arg_to_ioc_containers,
+                         keyword_only_names=frozenset()):
+    # type: (Callable, Tuple[basestring, ...], Dict[basestring, Any], Optional[basestring], Optional[basestring], Tuple[Tuple[basestring, basestring, Any], ...], FrozenSet[basestring], Dict[basestring, Tuple[IOCContainer, ...]], FrozenSet[basestring]) -> Callable
+    """
+    Generates, without needing target's source code, a function with target's signature which runs the injection
+    prologue and then forwards every argument to target:
+        def target_name(a, b=INJECTED, *args, **kwargs):
+            <prologue, see _generate_prologue>
+            return ___INJECT_TARGET_INTERNAL(a, b, *args, **kwargs)
+
+    Arguments in keyword_only_names are forwarded by keyword (`c=c`); the caller ensures they come after the others
+    and that target has no *args, since Python 2 cannot declare them keyword-only in the shim.
+
+    Default values are looked up from the shim's own globals, so they are compared by identity like in rewrite_ast.
+    """
+    injected_arguments = _injected_arguments(injectable_arguments_tuple, optional_arguments, arg_to_ioc_containers)
+
+    globals_dict = {_INTERNAL_CONTEXT_NAME: get_fast_retrieval_context(),
+                    _INTERNAL_TARGET_NAME: target}
+    default_names = {}
+    for (index, argument_name) in enumerate(argument_names):
+        if argument_name in argument_default_values:
+            default_names[argument_name] = '___INJECT_DEFAULT_{}'.format(index)
+            globals_dict[default_names[argument_name]] = argument_default_values[argument_name]
+
+    function_name = getattr(target, '__name__', 'injected')
+    shim = FunctionDef(
+        name=function_name,
+        args=arguments(args=[Name(id=argument_name, ctx=Param()) for argument_name in argument_names],
+                       vararg=vararg,
+                       kwarg=kwarg,
+                       defaults=[Name(id=default_names[argument_name], ctx=Load())
+                                 for argument_name in argument_names if argument_name in default_names]),
+        body=_generate_prologue(injected_arguments,
+                                {argument_name: Name(id=default_names[argument_name], ctx=Load())
+                                 for (argument_name, _, _) in injected_arguments},
+                                {'lineno': 1, 'col_offset': 0}) + [
+            Return(value=Call(func=Name(id=_INTERNAL_TARGET_NAME, ctx=Load()),
+                              args=[Name(id=argument_name, ctx=Load()) for argument_name in argument_names
+                                    if argument_name not in keyword_only_names],
+                              keywords=[keyword(arg=argument_name, value=Name(id=argument_name, ctx=Load()))
+                                        for argument_name in argument_names if argument_name in keyword_only_names],
+                              starargs=Name(id=vararg, ctx=Load()) if vararg else None,
+                              kwargs=Name(id=kwarg, ctx=Load()) if kwarg else None))],
+        decorator_list=[])
+    module = fix_missing_locations(Module(body=[shim]))
+
+    locals_dict = {}
+    eval(compile(module, filename='<injecting shim for {!r}>'.format(target), mode='exec'), globals_dict, locals_dict)
+    return update_wrapper(locals_dict[function_name], target, assigned=_available_attributes(target))
+
+
+def _available_attributes(wrapped):
+    return tuple(attribute for attribute in WRAPPER_ASSIGNMENTS if hasattr(wrapped, attribute))
@@ -0,0 +1,132 @@
+"""
+Lists every injected callable of a package, with the engine injecting into it and what its decoration cost.
+
+    python -m roro_ioc.audit my_package
+    python -m roro_ioc.audit --json my_package > injection.json
+    python -m roro_ioc.audit --min-fast-path-coverage 95 my_package  # Exits with 1 below 95%
+
+The package and all of its submodules are imported, so only decorations happening at import time are seen.
+Callables using the wrapping engine read their resources through `provided` on every call instead of through the
+fast retrieval context; the reason column tells why they ended up there.
+"""
+import argparse
+import json
+import pkgutil
+import sys
+from importlib import import_module
+
+from typing import Dict, List, Sequence, Tuple
+
+from roro_ioc.container import IOCContainer
+from roro_ioc.inject import InjectionRecord, add_decoration_listener, remove_decoration_listener, FAST_ENGINES
+
+
+def describe_container(container):
+    # type: (IOCContainer) -> basestring
+    resource_type = getattr(container, 'injected_resource_type', None)
+    if resource_type is not None:
+        return '{}.{}'.format(resource_type.__module__, resource_type.__name__)
+    fields = getattr(container, 'fields', None)
+    if fields is not None:
+        return 'schema({})'.format(', '.join(fields))
+    return repr(container)
+
+
+def _import_package(package_name, import_errors):
+    # type: (basestring, List[Tuple[basestring, basestring]]) -> None
+    package = import_module(package_name)
+    if not hasattr(package, '__path__'):
+        return  # A plain module
+
+    def on_error(module_name):
+        import_errors.append((module_name, repr(sys.exc_info()[1])))
+
+    for (_, module_name, _) in pkgutil.walk_packages(package.__path__, package_name + '.', onerror=on_error):
+        try:
+            import_module(module_name)
+        except Exception as e:
+            import_errors.append((module_name, repr(e)))
+
+
+def collect(package_names):
+    # type: (Sequence[basestring]) -> Tuple[List[InjectionRecord], List[Tuple[basestring, basestring]]]
+    records = []  # type: List[InjectionRecord]
+    import_errors = []  # type: List[Tuple[basestring, basestring]]
+    add_decoration_listener(records.append)
+    try:
+        for package_name in package_names:
+            _import_package(package_name, import_errors)
+    finally:
+        remove_decoration_listener(records.append)
+    return records, import_errors
+
+
+def summarize(records):
+    # type: (Sequence[InjectionRecord]) -> Dict[basestring, object]
+    fast_path = sum(1 for record in records if record.engine in FAST_ENGINES)
+    return {
+        'injected_callables': len(records),
+        'fast_path': fast_path,
+        'fast_path_coverage': 100.0 * fast_path / len(records) if records else 100.0,
+        'decoration_seconds': sum(record.decoration_seconds for record in records),
+    }
+
+
+def _record_to_json(record):
+    # type: (InjectionRecord) -> Dict[basestring, object]
+    return {
+        'name': record.qualified_name,
+        'engine': record.engine,
+        'fast_path': record.engine in FAST_ENGINES,
+        'reason': record.reason,
+        'injected_arguments': [{'argument': argument, 'resource': resource}
+                               for (argument, resource) in record.injected_arguments],
+        'containers': sorted(describe_container(container) for container in record.containers),
+        'decoration_ms': 1000 * record.decoration_seconds,
+    }
+
+
+def _print_table(records, summary, import_errors, output):
+    for record in sorted(records, key=lambda r: (r.engine in FAST_ENGINES, r.qualified_name)):
+        output.write('{:<15} {:>9.3f}ms  {}({}) <- {}{}\n'.format(
+            record.engine,
+            1000 * record.decoration_seconds,
+            record.qualified_name,
+            ', '.join(argument for (argument, _) in record.injected_arguments),
+            ', '.join(sorted(describe_container(container) for container in record.containers)),
+            ' [{}]'.format(record.reason) if record.reason else ''))
+    for (module_name, error) in import_errors:
+        output.write('could not import {}: {}\n'.format(module_name, error))
+    output.write('{fast_path}/{injected_callables} injected callables on the fast path ({fast_path_coverage:.1f}%), '
+                 '{decoration_seconds:.3f}s spent decorating\n'.format(**summary))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m roro_ioc.audit', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('packages', nargs='+', help='Packages or modules to import and audit')
+    parser.add_argument('--json', action='store_true', help='Output JSON instead of a table')
+    parser.add_argument('--min-fast-path-coverage', type=float, default=None, metavar='PERCENT',
+                        help='Exit with status 1 if fewer injected callables are on the fast path')
+    arguments = parser.parse_args(argv)
+
+    records, import_errors = collect(arguments.packages)
+    summary = summarize(records)
+    if arguments.json:
+        json.dump({'summary': summary,
+                   'callables': [_record_to_json(record) for record in records],
+                   'import_errors': [{'module': module_name, 'error': error}
+                                     for (module_name, error) in import_errors]},
+                  sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        _print_table(records, summary, import_errors, sys.stdout)
+
+    if arguments.min_fast_path_coverage is not None and \
+            summary['fast_path_coverage'] < arguments.min_fast_path_coverage:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
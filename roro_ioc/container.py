@@ -1,6 +1,7 @@
 from abc import ABCMeta, abstractproperty
+from operator import attrgetter
 
-from typing import FrozenSet
+from typing import Any, Callable, FrozenSet, Optional, Tuple
 
 
 class CannotBeProvided(ValueError):
@@ -10,6 +11,10 @@ class CannotBeProvided(ValueError):
 class IOCContainer(object):
     __metaclass__ = ABCMeta
 
+    # Injecting from a container also injects what its parent provides, unless the container provides it too and is
+    # armed; see lineage()
+    parent = None  # type: Optional[IOCContainer]
+
     @abstractproperty
     def provides(self):
         # type: ()->FrozenSet[basestring]
@@ -19,3 +24,28 @@ class IOCContainer(object):
     def provided(self):
         # type: ()->object
         pass
+
+    def resource_getter(self, resource_name):
+        # type: (basestring)->Callable[[Any], Any]
+        """
+        Returns a function reading resource_name out of what `provided` returns.
+        """
+        return attrgetter(resource_name)
+
+    def mark_used(self, resource_name):
+        # type: (basestring)->None
+        """
+        Called for each resource a callable injects from this container, when the callable is decorated.
+        """
+
+
+def lineage(ioc_container):
+    # type: (IOCContainer)->Tuple[IOCContainer, ...]
+    """
+    The container followed by its ancestors, nearest first.
+    """
+    result = []
+    while ioc_container is not None:
+        result.append(ioc_container)
+        ioc_container = ioc_container.parent
+    return tuple(result)
@@ -1,26 +1,82 @@
 import threading
 from abc import ABCMeta
+from array import array
+from bisect import bisect_left
+from weakref import WeakValueDictionary
 
 import attr
-from typing import Dict, Any
+from typing import Dict, Any, FrozenSet, Set, Tuple
 
 from roro_ioc.container import IOCContainer
 from roro_ioc.exceptions import NoValuesProvided
 
 
+class RegistryFrozen(TypeError):
+    pass
+
+
 @attr.attrs
 class _ContainerFieldRegistry(object):
+    # Per container, so no (container, resource name) key tuple is kept per resource
     _mapping = attr.attrib(
         validator=attr.validators.instance_of(dict),
-        default=attr.Factory(dict))  # type: Dict[Tuple[IOCContainer, basestring], int]
+        default=attr.Factory(dict))  # type: Dict[IOCContainer, Dict[basestring, int]]
+    _size = attr.attrib(default=0)  # type: int
+    # Only writers take the lock: readers go through single dict lookups, and a handle is published only once final
+    _lock = attr.attrib(default=attr.Factory(threading.Lock), repr=False, cmp=False)
 
     # TODO: handle the leakage of IOC Containers Contexts (not their contents - those should not leak!)
     def add(self, ioc_container):
-        for resource_name in ioc_container.provides:
-            self._mapping[(ioc_container, resource_name)] = len(self._mapping)
+        # Handles of a container are contiguous and follow the sorted resource names, see freeze()
+        with self._lock:
+            base = self._size
+            handles = {resource_name: base + position
+                       for (position, resource_name) in enumerate(sorted(ioc_container.provides))}
+            self._mapping[ioc_container] = handles
+            self._size = base + len(handles)
+
+    def get(self, ioc_container, field):
+        return self._mapping[ioc_container][field]
+
+    def size(self):
+        return self._size
+
+    def freeze(self):
+        # type: () -> _FrozenContainerFieldRegistry
+        containers = tuple(self._mapping)
+        return _FrozenContainerFieldRegistry(
+            container_indices={ioc_container: index for (index, ioc_container) in enumerate(containers)},
+            bases=array('l', (min(self._mapping[ioc_container].itervalues()) if self._mapping[ioc_container] else 0
+                              for ioc_container in containers)),
+            names=tuple(tuple(sorted(self._mapping[ioc_container])) for ioc_container in containers),
+            size=self._size)
+
+
+@attr.attrs(frozen=True, slots=True)
+class _FrozenContainerFieldRegistry(object):
+    """
+    Immutable form of _ContainerFieldRegistry, meant to be built in the parent of a prefork server.
+    Instead of one dict per container it holds one array entry per container: resource handles
+    are recovered by bisecting the container's sorted resource names, so lookups do not write to any of its objects.
+    """
+    _container_indices = attr.attrib()  # type: Dict[IOCContainer, int]
+    _bases = attr.attrib()  # type: array
+    _names = attr.attrib()  # type: Tuple[Tuple[basestring, ...], ...]
+    _size = attr.attrib()  # type: int
+
+    def add(self, ioc_container):
+        raise RegistryFrozen('Cannot register {} after the registry was frozen'.format(ioc_container))
 
     def get(self, ioc_container, field):
-        return self._mapping[(ioc_container, field)]
+        index = self._container_indices[ioc_container]
+        names = self._names[index]
+        position = bisect_left(names, field)
+        if position == len(names) or names[position] != field:
+            raise KeyError((ioc_container, field))
+        return self._bases[index] + position
+
+    def size(self):
+        return self._size
 
 
 _IOC_CONTAINER_FIELD_REGISTRY = _ContainerFieldRegistry()
@@ -30,24 +86,106 @@ def get_fast_retrieval_resource_handle(ioc_container, resource_name):
     return _IOC_CONTAINER_FIELD_REGISTRY.get(ioc_container, resource_name)
 
 
+def get_fast_retrieval_resources_count():
+    return _IOC_CONTAINER_FIELD_REGISTRY.size()
+
+
+# Resources read by decorated callables, per container. The generation changes whenever a resource is first used,
+# so what is derived from usage (see ArmableIOCContainer._arming_plan) can be cached against it.
+_USED_RESOURCE_NAMES = {}  # type: Dict[IOCContainer, Set[basestring]]
+_USAGE_LOCK = threading.Lock()
+_usage_generation = 0
+
+
+def mark_resource_used(ioc_container, resource_name):
+    # type: (IOCContainer, basestring) -> bool
+    """
+    Records that a decorated callable reads resource_name from ioc_container. Returns whether it was not yet used.
+    """
+    global _usage_generation
+    used = _USED_RESOURCE_NAMES.get(ioc_container)
+    if used is not None and resource_name in used:
+        return False
+    with _USAGE_LOCK:
+        used = _USED_RESOURCE_NAMES.setdefault(ioc_container, set())
+        if resource_name in used:
+            return False
+        used.add(resource_name)
+        _usage_generation += 1
+        return True
+
+
+def get_used_resource_names(ioc_container):
+    # type: (IOCContainer) -> FrozenSet[basestring]
+    with _USAGE_LOCK:
+        return frozenset(_USED_RESOURCE_NAMES.get(ioc_container, ()))
+
+
+def get_resources_usage_generation():
+    # type: () -> int
+    return _usage_generation
+
+
+def freeze_registry():
+    """
+    Replaces the registry with its compact immutable form. Containers cannot be created afterwards.
+    """
+    global _IOC_CONTAINER_FIELD_REGISTRY
+    if isinstance(_IOC_CONTAINER_FIELD_REGISTRY, _ContainerFieldRegistry):
+        _IOC_CONTAINER_FIELD_REGISTRY = _IOC_CONTAINER_FIELD_REGISTRY.freeze()
+
+
 class ResourcesHolder(object):
     __metaclass__ = ABCMeta
 
     resources = {}  # type: Dict[basestring, Any]
 
 
-_CONTAINER_FIELDS = threading.local()  # type: ResourcesHolder
-
-
 def _flag_missing(field_name):
     raise NoValuesProvided('Mandatory field <{}> was not provided'.format(field_name))
 
 
-_CONTAINER_FIELDS.flag_missing = _flag_missing
+class _Resources(list):
+    # A list subclass, as only those can be weakly referenced
+    __slots__ = ('__weakref__',)
+
+
+# The resources lists of live threads by id, extended whenever a container is registered. Lists of threads which are
+# over are dropped with their thread locals. Lists compare by content, hence no WeakSet.
+_THREAD_RESOURCES = WeakValueDictionary()  # type: WeakValueDictionary[int, _Resources]
+_THREAD_RESOURCES_LOCK = threading.Lock()
+
+
+class _ContainerFields(threading.local):
+    # Runs once in each thread which touches the context, so every thread gets its own placeholder-filled resources
+    def __init__(self):
+        self.flag_missing = _flag_missing
+        with _THREAD_RESOURCES_LOCK:
+            self.resources = _Resources([self] * get_fast_retrieval_resources_count())
+            _THREAD_RESOURCES[id(self.resources)] = self.resources
+
+
+_CONTAINER_FIELDS = _ContainerFields()  # type: ResourcesHolder
+
+
+def ensure_resources_length(fast_retrieval_context):
+    # Cover every registered container, not just the one being armed, so injecting from a container which is not
+    # armed finds the placeholder rather than running past the end of the list
+    resources_count = get_fast_retrieval_resources_count()
+    current_length = len(fast_retrieval_context.resources)
+    if resources_count > current_length:
+        fast_retrieval_context.resources.extend([fast_retrieval_context] * (resources_count - current_length))
 
 
 def register_ioc_container(ioc_container):
-    _IOC_CONTAINER_FIELD_REGISTRY.add(ioc_container)
+    # Every thread's resources cover the new container before anything can be injected from it, so a thread which
+    # never armed it reads the placeholder - whichever thread it started on, and whenever
+    with _THREAD_RESOURCES_LOCK:
+        _IOC_CONTAINER_FIELD_REGISTRY.add(ioc_container)
+        resources_count = get_fast_retrieval_resources_count()
+        for resources in _THREAD_RESOURCES.values():
+            if resources_count > len(resources):
+                resources.extend([_CONTAINER_FIELDS] * (resources_count - len(resources)))
 
 
 def get_fast_retrieval_context():
@@ -1,51 +1,128 @@
+import inspect
+from functools import partial
 from inspect import getargspec
 from logging import getLogger
 
 import attr
-from typing import Callable, Dict, Any, Tuple
-from werkzeug.datastructures import ImmutableDict
+from typing import Callable, Dict, Any, Tuple, Optional, FrozenSet
 
 _logger = getLogger(__name__)
 
 
-@attr.attrs
+# Only lives while a callable is decorated; argument_default_values must not be mutated
+@attr.attrs(slots=True)
 class FactorySpecification(object):
     constructing_function = attr.attrib()  # type: Callable
     argument_names = attr.attrib(validator=attr.validators.instance_of(tuple))  # type: Tuple[basestring, ...]
-    argument_default_values = attr.attrib(validator=attr.validators.instance_of(
-        ImmutableDict))  # type: Dict[basestring, Any]
+    argument_default_values = attr.attrib(validator=attr.validators.instance_of(dict))  # type: Dict[basestring, Any]
+    varargs_name = attr.attrib(default=None)  # type: Optional[basestring]
+    keywords_name = attr.attrib(default=None)  # type: Optional[basestring]
+    # Arguments which can only be passed by keyword, e.g. those after one bound by keyword in a partial. Calls
+    # forward them by keyword, and positional arguments never reach them.
+    keyword_only_names = attr.attrib(default=frozenset())  # type: FrozenSet[basestring]
+    # Arguments the callable gives a value to itself, e.g. the keywords of a partial; they are never injected
+    bound_names = attr.attrib(default=frozenset())  # type: FrozenSet[basestring]
 
 
 def _format_defaults(arg_names, defaults):
     defaults = defaults or ()
     defaults_matching = (attr.NOTHING,) * (len(arg_names) - len(defaults)) + defaults
-    return ImmutableDict((arg_name, default_value) for (arg_name, default_value)
-                         in zip(arg_names, defaults_matching)
-                         if default_value != attr.NOTHING)
+    return {arg_name: default_value for (arg_name, default_value) in zip(arg_names, defaults_matching)
+            if default_value is not attr.NOTHING}
 
 
 def extract_factory_specification_for_attrs(type_, allow_defaults):
     fields = [field for field in attr.fields(type_)
-              if allow_defaults or field.default == attr.NOTHING]
+              if allow_defaults or field.default is attr.NOTHING]
 
     argument_names = tuple(field.name for field in fields)
-    defaults = ImmutableDict((field.name, field.default) for field in fields
-                             if field.default != attr.NOTHING)
+    defaults = {field.name: field.default for field in fields
+                if field.default is not attr.NOTHING}
     subject_callable = type_
     return FactorySpecification(subject_callable, argument_names, defaults)
 
 
+def _extract_factory_specification_for_signature(functional_object, signature):
+    # Parameters are read by kind, so both inspect.Signature and its backports are supported
+    argument_names = []
+    defaults = {}
+    varargs_name = keywords_name = None
+    keyword_only_names = set()
+    for parameter in signature.parameters.values():
+        if parameter.kind == parameter.VAR_POSITIONAL:
+            varargs_name = parameter.name
+        elif parameter.kind == parameter.VAR_KEYWORD:
+            keywords_name = parameter.name
+        else:
+            argument_names.append(parameter.name)
+            if parameter.default is not parameter.empty:
+                defaults[parameter.name] = parameter.default
+            if parameter.kind == parameter.KEYWORD_ONLY:
+                keyword_only_names.add(parameter.name)
+    return FactorySpecification(functional_object, tuple(argument_names), defaults, varargs_name, keywords_name,
+                                frozenset(keyword_only_names))
+
+
+def _extract_factory_specification_for_partial(partial_object):
+    """
+    The arguments of the wrapped callable which the partial leaves open. Those bound by keyword keep the bound value
+    as their default and are not injected, and since the partial passes them by keyword, they and every argument
+    after them can only be passed by keyword.
+    """
+    wrapped = _extract_factory_specification_for_functions(partial_object.func)
+    bound_keywords = partial_object.keywords or {}
+    bound_self = 1 if inspect.ismethod(partial_object.func) and partial_object.func.im_self is not None else 0
+    argument_names = wrapped.argument_names[bound_self + len(partial_object.args):]
+    defaults = {argument_name: wrapped.argument_default_values[argument_name]
+                for argument_name in argument_names if argument_name in wrapped.argument_default_values}
+    defaults.update((argument_name, value) for (argument_name, value) in bound_keywords.iteritems()
+                    if argument_name in argument_names)
+    keyword_only_names = set(wrapped.keyword_only_names)
+    for (position, argument_name) in enumerate(argument_names):
+        if argument_name in bound_keywords:
+            keyword_only_names.update(argument_names[position:])
+            break
+    return FactorySpecification(partial_object, argument_names, defaults, wrapped.varargs_name,
+                                wrapped.keywords_name, frozenset(keyword_only_names).intersection(argument_names),
+                                frozenset(bound_keywords).intersection(argument_names))
+
+
 def _extract_factory_specification_for_functions(functional_object):
-    argument_names = ()
-    defaults = ImmutableDict()
+    if isinstance(functional_object, partial):
+        return _extract_factory_specification_for_partial(functional_object)
+
+    signature = getattr(functional_object, '__signature__', None)
+    if signature is not None:
+        return _extract_factory_specification_for_signature(functional_object, signature)
+
+    skipped_arguments = 0
+    subject_callable = functional_object
+    if not (inspect.isfunction(functional_object) or inspect.ismethod(functional_object)):
+        # Callable objects are inspected through their __call__, which is bound to them
+        subject_callable = getattr(functional_object, '__call__', None)
+        skipped_arguments = 1
+    if inspect.ismethod(subject_callable) and subject_callable.im_self is None:
+        skipped_arguments = 0  # e.g. a metaclass' __call__, still unbound
+
     try:
-        argspec = getargspec(functional_object)
-        argument_names = tuple(argspec.args)
-        defaults = _format_defaults(argument_names, argspec.defaults)
+        argspec = getargspec(subject_callable)
     except TypeError:
-        _logger.exception('Could not get argument specs for %s', functional_object)
+        signature_of = getattr(inspect, 'signature', None)  # Python 3.3+
+        if signature_of is not None:
+            try:
+                return _extract_factory_specification_for_signature(functional_object, signature_of(functional_object))
+            except (TypeError, ValueError):
+                pass
+        # Built-ins and other callables which cannot be introspected; nothing can be injected into them
+        _logger.debug('Could not get argument specs for %s', functional_object)
+        return FactorySpecification(functional_object, (), {})
 
-    return FactorySpecification(functional_object, argument_names, defaults)
+    argument_names = tuple(argspec.args[skipped_arguments:])
+    return FactorySpecification(functional_object,
+                                argument_names,
+                                _format_defaults(tuple(argspec.args), argspec.defaults),
+                                argspec.varargs,
+                                argspec.keywords)
 
 
 def extract_factory_specification(type_or_factory, allow_defaults=True):
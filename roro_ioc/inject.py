@@ -1,39 +1,98 @@
 import inspect
 import new
-from functools import wraps
+import sys
+from functools import partial, wraps
 from logging import getLogger
 from os import environ
+from timeit import default_timer
 
-from typing import Optional
+import attr
+from typing import Callable, Dict, List, Optional, Tuple
 
-from roro_ioc.ast_injection import rewrite_ast
-from roro_ioc.container import IOCContainer
+from roro_ioc.ast_injection import rewrite_ast, build_injecting_shim, SourceCodeInaccessibleError, \
+    _available_attributes
+from roro_ioc.container import IOCContainer, lineage
 from roro_ioc.exceptions import NoSourceForArgument, NoDefaultValueForArgument, DoubleProvidingProhibited
 from roro_ioc.exceptions import NoValuesProvided
 from roro_ioc.factory_inspection import extract_factory_specification, FactorySpecification
-from roro_ioc.injected_tag import INJECTED
+from roro_ioc.injected_tag import INJECTED, InjectedTag
 
 _USE_WRAPPING_INJECTOR = environ.get('TWG_WRAPPING_INJECTOR')
 
-_logger = getLogger()
+ENGINE_REWRITE_AST = 'rewrite_ast'
+ENGINE_GENERATOR_SHIM = 'generator_shim'
+ENGINE_CALL_SHIM = 'call_shim'
+ENGINE_WRAPPING = 'wrapping'
+# Engines which resolve resources straight from the fast retrieval context
+FAST_ENGINES = frozenset((ENGINE_REWRITE_AST, ENGINE_GENERATOR_SHIM, ENGINE_CALL_SHIM))
+
+
+@attr.attrs(frozen=True, slots=True)
+class InjectionRecord(object):
+    """
+    Describes one decorated callable: the engine injecting into it, why the wrapping engine was used if it was,
+    the (argument, resource) pairs injected, the containers they come from and how long decoration took.
+    """
+    qualified_name = attr.attrib()  # type: basestring
+    engine = attr.attrib()  # type: basestring
+    reason = attr.attrib()  # type: Optional[basestring]
+    injected_arguments = attr.attrib()  # type: Tuple[Tuple[basestring, basestring], ...]
+    containers = attr.attrib()  # type: Tuple[IOCContainer, ...]
+    decoration_seconds = attr.attrib()  # type: float
+
+
+# Called with an InjectionRecord for every callable decorated while registered; see roro_ioc.audit
+_DECORATION_LISTENERS = []  # type: List[Callable[[InjectionRecord], None]]
+
+
+def add_decoration_listener(listener):
+    _DECORATION_LISTENERS.append(listener)
+
+
+def remove_decoration_listener(listener):
+    _DECORATION_LISTENERS.remove(listener)
+
+
+def _qualified_name(type_or_callable, class_name):
+    # type: (Callable, Optional[basestring]) -> basestring
+    # class_name is only known for inject_methods on Python 2, where there is no __qualname__
+    if isinstance(type_or_callable, partial):
+        return 'partial({})'.format(_qualified_name(type_or_callable.func, class_name))
+    if not hasattr(type_or_callable, '__name__'):  # A callable object, named after its class
+        return '{} instance'.format(_qualified_name(type(type_or_callable), class_name))
+    name = getattr(type_or_callable, '__qualname__', None)
+    if name is None:
+        name = type_or_callable.__name__
+        if class_name:
+            name = '{}.{}'.format(class_name, name)
+    module = getattr(type_or_callable, '__module__', None)
+    return '{}.{}'.format(module, name) if module else name
+
+
+def _is_expressible_in_shim(factory_specification):
+    # type: (FactorySpecification) -> bool
+    # Python 2 has no keyword-only arguments: the shim declares them as regular arguments, which *args would capture
+    # positional arguments before, and which need defaults once an argument before them has one
+    if factory_specification.keyword_only_names and factory_specification.varargs_name:
+        return False
+    has_default = False
+    for argument_name in factory_specification.argument_names:
+        if argument_name in factory_specification.argument_default_values:
+            has_default = True
+        elif has_default:
+            return False
+    return True
 
 
-def __get_class_name():
-    stack_frame = inspect.currentframe().f_back.f_back
-    self = stack_frame.f_locals.get('self', None)
-    if stack_frame.f_code.co_name == '<module>' or '__module__' not in stack_frame.f_locals:
-        # only classes have this:
-        return None
-    else:
-        return stack_frame.f_code.co_name
+_logger = getLogger()
 
 
 def inject(*injectors):
-    return __inject_internal('', injectors, __get_class_name())
+    return __inject_internal('', injectors, None)
 
 
 def inject_(*injectors):
-    return __inject_internal('_', injectors, __get_class_name())
+    return __inject_internal('_', injectors, None)
 
 
 def inject_methods(*injectors):
@@ -92,18 +151,25 @@ def __inject_methods_internal(suffix, injectors):
 def __inject_internal(suffix, injectors, class_name):
     suffix_length = len(suffix) if suffix else 0
 
-    arg_to_ioc_container = {name: injector
-                            for injector in injectors
-                            for name in injector.provides}
-
-    # Reverse order - first injector overrides
-    already_seen = set()
+    # Per resource, its providers among the injectors and their ancestors, nearest first. Providers of a resource
+    # must all be in one lineage, the nearest armed one providing it. Containers are attrs classes comparing equal
+    # field by field, so distinct containers of one payload type are told apart by identity.
+    providers = {}  # type: Dict[basestring, List[IOCContainer]]
     for injector in injectors:
-        for name in injector.provides:
-            if name in already_seen:
-                raise DoubleProvidingProhibited('Resource %s provided twice, injectors %s',
-                                                name, arg_to_ioc_container)
-            already_seen.add(name)
+        for ioc_container in lineage(injector):
+            for name in ioc_container.provides:
+                name_providers = providers.setdefault(name, [])
+                if not any(provider is ioc_container for provider in name_providers):
+                    name_providers.append(ioc_container)
+
+    arg_to_ioc_containers = {}  # type: Dict[basestring, Tuple[IOCContainer, ...]]
+    for (name, name_providers) in providers.iteritems():
+        ordered = tuple(sorted(name_providers, key=lambda ioc_container: -len(lineage(ioc_container))))
+        for (descendant, ancestor) in zip(ordered, ordered[1:]):
+            if not any(ancestor is ioc_container for ioc_container in lineage(descendant)):
+                raise DoubleProvidingProhibited('Resource {} provided by unrelated injectors {}'.format(
+                    name, ordered))
+        arg_to_ioc_containers[name] = ordered
 
     def correspondence(argument_name):
         # type: (basestring) -> Optional[basestring]
@@ -114,19 +180,21 @@ def __inject_internal(suffix, injectors, class_name):
             result = argument_name[:-suffix_length]
         else:
             result = argument_name
-        if result in arg_to_ioc_container:
+        if result in arg_to_ioc_containers:
             return result
         else:
             return None  # is not provided
 
-    def decorate(type_or_callable):
+    def inject_into(type_or_callable):
+        # type: (Callable) -> Tuple[Callable, Optional[basestring], Optional[basestring], Tuple[Tuple[basestring, basestring, int], ...]]
+        # Returns the decorated callable, the engine used and why (None when nothing is injected), and the arguments
         factory_specification = extract_factory_specification(type_or_callable)  # type: FactorySpecification
 
         injectable_arguments = {argument: corresponding
                                 for (argument, corresponding) in
                                 ((argument, correspondence(argument)) for argument in
                                  factory_specification.argument_names)
-                                if corresponding is not None}
+                                if corresponding is not None and argument not in factory_specification.bound_names}
 
         # This is a mapping to e.g. 'mydata_' to 'mydata'
 
@@ -140,7 +208,7 @@ def __inject_internal(suffix, injectors, class_name):
                         'Argument {} in callable {} implied to be injectable, but no default value was specified'.
                             format(argument_name, type_or_callable))
             else:
-                if result is INJECTED and argument_name not in injectable_arguments:
+                if isinstance(result, InjectedTag) and argument_name not in injectable_arguments:
                     raise NoSourceForArgument('Cannot inject argument {} into callable {}, injectable arguments {}'.
                                               format(argument_name, type_or_callable,
                                                      injectable_arguments.keys()))
@@ -151,9 +219,14 @@ def __inject_internal(suffix, injectors, class_name):
         # We do this only after calculating injection_treatment, so we can catch variables marked as INJECT who do not
         # have a source
         if len(injectable_arguments) == 0:
-            return type_or_callable  # Nothing to do here
-
-        arg_to_position = {arg_name: index
+            return type_or_callable, None, None, ()  # Nothing to do here
+
+        # The constructor of a non-attrs class is inspected through __init__, whose self is not passed by callers
+        skipped_arguments = 1 if isinstance(type_or_callable, type) and \
+            factory_specification.constructing_function is not type_or_callable else 0
+        # Keyword-only arguments are never filled by positional arguments
+        arg_to_position = {arg_name: (sys.maxint if arg_name in factory_specification.keyword_only_names
+                                      else index - skipped_arguments)
                            for (index, arg_name) in enumerate(factory_specification.argument_names)
                            if arg_name in injectable_arguments}
 
@@ -161,33 +234,110 @@ def __inject_internal(suffix, injectors, class_name):
         injectable_arguments_tuple = tuple((argument, corresponding, arg_to_position[argument])
                                            for (argument, corresponding) in injectable_arguments.iteritems())
 
-        def _raise_missing(argument, corresponding):
-            if argument not in factory_specification.argument_default_values or \
-                    factory_specification.argument_default_values[argument] is INJECTED:
-                raise NoValuesProvided('Cannot provide for value {}'.format(corresponding))
-
-        if not _USE_WRAPPING_INJECTOR:
-            if inspect.isfunction(type_or_callable) or \
-                    inspect.ismethod(type_or_callable) or inspect.ismethoddescriptor(type_or_callable):
+        optional_tags = {argument: tag for (argument, tag) in
+                         ((argument, factory_specification.argument_default_values[argument])
+                          for argument in injectable_arguments)
+                         if isinstance(tag, InjectedTag) and tag.optional}
+
+        if _USE_WRAPPING_INJECTOR:
+            wrapping_reason = 'TWG_WRAPPING_INJECTOR is set'
+        elif inspect.isgeneratorfunction(type_or_callable):
+            # A rewritten generator would only resolve its arguments on the first next(), possibly after its
+            # containers were disarmed. Resolve them in a plain function instead, which forwards to the generator.
+            return build_injecting_shim(type_or_callable,
+                                        factory_specification.argument_names,
+                                        factory_specification.argument_default_values,
+                                        factory_specification.varargs_name,
+                                        factory_specification.keywords_name,
+                                        injectable_arguments_tuple,
+                                        frozenset(optional_tags),
+                                        arg_to_ioc_containers), ENGINE_GENERATOR_SHIM, None, injectable_arguments_tuple
+        elif inspect.isfunction(type_or_callable) or inspect.ismethod(type_or_callable):
+            try:
                 return rewrite_ast(type_or_callable,
-                                   class_name,
                                    injectable_arguments_tuple,
-                                   arg_to_ioc_container)
-
-        @wraps(type_or_callable)
+                                   frozenset(optional_tags),
+                                   arg_to_ioc_containers), ENGINE_REWRITE_AST, None, injectable_arguments_tuple
+            except SourceCodeInaccessibleError as e:
+                _logger.debug('Falling back to the wrapping injector for %s: %s', type_or_callable, e)
+                wrapping_reason = 'source code inaccessible'
+        elif isinstance(type_or_callable, type):
+            wrapping_reason = 'not a function'
+        elif not _is_expressible_in_shim(factory_specification):
+            wrapping_reason = 'signature cannot be declared in Python 2'
+        else:
+            # Partials, callable objects and callables only described by a signature: forward to them from a
+            # function declaring their signature, so arguments are resolved like in a rewritten function
+            return build_injecting_shim(type_or_callable,
+                                        factory_specification.argument_names,
+                                        factory_specification.argument_default_values,
+                                        factory_specification.varargs_name,
+                                        factory_specification.keywords_name,
+                                        injectable_arguments_tuple,
+                                        frozenset(optional_tags),
+                                        arg_to_ioc_containers,
+                                        factory_specification.keyword_only_names), \
+                ENGINE_CALL_SHIM, None, injectable_arguments_tuple
+
+        # Only what is needed per call is kept alive by the wrapper, not the specification or the container mapping.
+        # Providers are tried nearest first. When none is armed, optional arguments get their tag's default,
+        # mandatory ones raise and others fall back to their default implicitly.
+        wrapping_arguments = tuple((argument, corresponding, position_for_argument,
+                                    tuple((ioc_container, ioc_container.resource_getter(corresponding))
+                                          for ioc_container in arg_to_ioc_containers[corresponding]),
+                                    factory_specification.argument_default_values.get(argument, INJECTED) is INJECTED,
+                                    optional_tags.get(argument))
+                                   for (argument, corresponding, position_for_argument) in injectable_arguments_tuple)
+
+        @wraps(type_or_callable, assigned=_available_attributes(type_or_callable))
         def substitute_parameters(*args, **kwargs):
-            for (argument, corresponding, position_for_argument) in injectable_arguments_tuple:
+            for (argument, corresponding, position_for_argument, getters, mandatory, optional_tag) in \
+                    wrapping_arguments:
                 if position_for_argument < len(args) or argument in kwargs:
                     continue  # do not override this variable
-                provided = arg_to_ioc_container[corresponding].provided
-                try:
-                    kwargs[argument] = getattr(provided, corresponding)
-                except AttributeError:  # provided is None
-                    # If it has a default, and no provider is available for the data, let the default be used implicitly
-                    _raise_missing(argument, corresponding)
+                for (container, getter) in getters:
+                    provided = container.provided
+                    if provided is not None:
+                        kwargs[argument] = getter(provided)
+                        break
+                else:
+                    if optional_tag is not None:
+                        kwargs[argument] = optional_tag.default
+                    elif mandatory:
+                        raise NoValuesProvided('Cannot provide for value {}'.format(corresponding))
 
             return type_or_callable(*args, **kwargs)
 
-        return substitute_parameters
+        return substitute_parameters, ENGINE_WRAPPING, wrapping_reason, injectable_arguments_tuple
+
+    def mark_used(injectable_arguments_tuple):
+        for (_, corresponding, _) in injectable_arguments_tuple:
+            for ioc_container in arg_to_ioc_containers[corresponding]:
+                ioc_container.mark_used(corresponding)
+
+    def decorate(type_or_callable):
+        if not _DECORATION_LISTENERS:
+            (result, _, _, injectable_arguments_tuple) = inject_into(type_or_callable)
+            mark_used(injectable_arguments_tuple)
+            return result
+
+        start = default_timer()
+        (result, engine, reason, injectable_arguments_tuple) = inject_into(type_or_callable)
+        mark_used(injectable_arguments_tuple)
+        decoration_seconds = default_timer() - start
+        if engine is not None:
+            record = InjectionRecord(
+                qualified_name=_qualified_name(type_or_callable, class_name),
+                engine=engine,
+                reason=reason,
+                injected_arguments=tuple((argument, corresponding)
+                                         for (argument, corresponding, _) in injectable_arguments_tuple),
+                containers=tuple(frozenset(ioc_container
+                                           for (_, corresponding, _) in injectable_arguments_tuple
+                                           for ioc_container in arg_to_ioc_containers[corresponding])),
+                decoration_seconds=decoration_seconds)
+            for listener in _DECORATION_LISTENERS:
+                listener(record)
+        return result
 
     return decorate
@@ -3,9 +3,19 @@ import attr
 
 @attr.attrs
 class InjectedTag(object):
-    pass
+    # Optional arguments fall back to default when nothing provides them, instead of raising NoValuesProvided
+    optional = attr.attrib(default=False)  # type: bool
+    default = attr.attrib(default=None)
 
 
 INJECTED = InjectedTag()
 
-INJECTED_IF_AVAILABLE = InjectedTag()
+INJECTED_IF_AVAILABLE = InjectedTag(optional=True)
+
+
+def injected_if_available(default):
+    """
+    Like INJECTED_IF_AVAILABLE, with default used when no value is available: `def f(cache=injected_if_available(
+    NULL_CACHE))`.
+    """
+    return InjectedTag(optional=True, default=default)
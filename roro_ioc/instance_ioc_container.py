@@ -2,16 +2,19 @@ import inspect
 import itertools
 import threading
 from contextlib import contextmanager
+from operator import attrgetter
 
 import attr
 from attr.exceptions import NotAnAttrsClassError
-from attr.validators import instance_of
+from attr.validators import instance_of, optional
 from cached_property import cached_property
-from typing import FrozenSet
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
 
+from roro_ioc.accounting import ArmedAccounting, _clear_accounting_scopes
 from roro_ioc.container import IOCContainer
 from roro_ioc.container_field_registry import get_fast_retrieval_context, register_ioc_container, \
-    get_fast_retrieval_resource_handle
+    get_fast_retrieval_resource_handle, ensure_resources_length, mark_resource_used, get_used_resource_names, \
+    get_resources_usage_generation
 from roro_ioc.exceptions import InvalidPayload, CannotArmTwice
 
 
@@ -22,10 +25,130 @@ def _validate_condition(o, a, v):
 _STRUCTURED_LOCAL = threading.local()
 
 
+def _tuple_getter(getter_type, keys):
+    # type: (type, Tuple[Any, ...]) -> Callable[[Any], Tuple[Any, ...]]
+    # itemgetter/attrgetter only return a tuple when given more than one key
+    if not keys:
+        return lambda payload: ()
+    if len(keys) == 1:
+        single_getter = getter_type(keys[0])
+        return lambda payload: (single_getter(payload),)
+    return getter_type(*keys)
+
+
+class ArmableIOCContainer(IOCContainer):
+    """
+    Arming machinery shared by containers which fill the fast retrieval context from a payload.
+
+    Subclasses provide `provides`, `allow_idempotent_arming`, `accounting` (an ArmedAccounting or None),
+    `arm_used_resources_only` and _validate_payload, and may override _resource_names (the order in which resources
+    are extracted), _resource_extractor_for and _extract_resources.
+
+    Containers arming used resources only skip the resources which no decorated callable reads. A callable decorated
+    while the container is armed in another thread only sees its new resources there from the next arming.
+    """
+
+    @property
+    def _resource_names(self):
+        # type: () -> Tuple[basestring, ...]
+        return tuple(self.provides)
+
+    @property
+    def unused_resources(self):
+        # type: () -> FrozenSet[basestring]
+        """
+        Resources which no decorated callable reads.
+        """
+        return frozenset(self.provides) - get_used_resource_names(self)
+
+    def mark_used(self, resource_name):
+        if not mark_resource_used(self, resource_name) or not self.arm_used_resources_only:
+            return
+        payload = self.provided
+        if payload is not None:  # Armed in this thread while nothing used the resource, so its slot was skipped
+            get_fast_retrieval_context().resources[get_fast_retrieval_resource_handle(self, resource_name)] = \
+                self.resource_getter(resource_name)(payload)
+
+    def _arming_plan(self):
+        # type: () -> Tuple[int, Tuple[int, ...], Callable[[Any], Tuple[Any, ...]]]
+        """
+        The usage generation the plan was made for, the handles to arm and the extractor of their resources.
+        """
+        generation = get_resources_usage_generation() if self.arm_used_resources_only else 0
+        plan = self.__dict__.get('_cached_arming_plan')
+        if plan is None or plan[0] != generation:
+            resource_names = self._resource_names
+            if self.arm_used_resources_only:
+                used = get_used_resource_names(self)
+                resource_names = tuple(resource_name for resource_name in resource_names if resource_name in used)
+            plan = self.__dict__['_cached_arming_plan'] = (
+                generation,
+                tuple(get_fast_retrieval_resource_handle(self, resource_name) for resource_name in resource_names),
+                self._resource_extractor_for(resource_names))
+        return plan
+
+    def _resource_extractor_for(self, resource_names):
+        # type: (Tuple[basestring, ...]) -> Callable[[Any], Tuple[Any, ...]]
+        return _tuple_getter(attrgetter, resource_names)
+
+    def _extract_resources(self, extractor, payload):
+        # type: (Callable[[Any], Tuple[Any, ...]], Any) -> Tuple[Any, ...]
+        return extractor(payload)
+
+    def _validate_payload(self, payload):
+        return True
+
+    @contextmanager
+    def arm(self, payload):
+        newly_armed = self._arm(payload)
+        try:
+            yield
+        finally:
+            if newly_armed:
+                self._disarm()
+
+    def _arm(self, payload):
+        # type: (object) -> bool
+        """
+        Non-generator half of arm(), for callers that cannot afford a context manager per use (e.g. middleware).
+        Returns whether the container was armed by this call; only then should _disarm() be called.
+        """
+        self._validate_payload(payload)
+
+        existing = _STRUCTURED_LOCAL.__dict__.get(self)
+        if existing is not None:
+            if self.allow_idempotent_arming and existing is payload:
+                return False  # And do nothing else
+            raise CannotArmTwice()
+
+        accounting = self.accounting
+        if accounting is not None:
+            sample = accounting._sample(payload)
+        _integrate_resources(self, get_fast_retrieval_context(), payload)
+        _STRUCTURED_LOCAL.__dict__[self] = payload
+        if accounting is not None:
+            accounting._start(self, sample)
+        return True
+
+    def _disarm(self):
+        if _STRUCTURED_LOCAL.__dict__.pop(self, None) is None:
+            return  # Already disarmed by reset_after_fork, in a worker forked while this container was armed
+        _cleanup_resources(self, get_fast_retrieval_context())
+        if self.accounting is not None:
+            self.accounting._stop(self)
+
+    @property
+    def provided(self):
+        return _STRUCTURED_LOCAL.__dict__.get(self)
+
+
 @attr.attrs(hash=False)
-class InstanceIOCContainer(IOCContainer):
+class InstanceIOCContainer(ArmableIOCContainer):
     injected_resource_type = attr.attrib(validator=_validate_condition)  # type: type
     allow_idempotent_arming = attr.attrib(validator=instance_of(bool))  # type: bool
+    accounting = attr.attrib(default=None)  # type: Optional[ArmedAccounting]
+    parent = attr.attrib(default=None, validator=optional(instance_of(IOCContainer)))  # type: Optional[IOCContainer]
+    arm_used_resources_only = attr.attrib(default=False, validator=instance_of(bool))  # type: bool
 
     @cached_property
     def provides(self):
@@ -51,62 +174,144 @@ class InstanceIOCContainer(IOCContainer):
             raise InvalidPayload()
         return True
 
-    @contextmanager
-    def arm(self, payload):
-        self._validate_payload(payload)
-
-        fast_retrieval_context = get_fast_retrieval_context()
-        existing = _STRUCTURED_LOCAL.__dict__.get(self)
-        if existing is not None:
-            if (self.allow_idempotent_arming and
-                    existing is payload):
-                yield
-                # And do nothing else
-            else:
-                raise CannotArmTwice()
-        else:  # Is currently empty
-            _integrate_resources(self, fast_retrieval_context, payload)
-            _STRUCTURED_LOCAL.__dict__[self] = payload
-            try:
-                yield
-
-            finally:
-                del _STRUCTURED_LOCAL.__dict__[self]
-                _cleanup_resources(self, fast_retrieval_context)
-
-    @property
-    def provided(self):
-        return _STRUCTURED_LOCAL.__dict__.get(self)
-
 
 # fast_retrieval_context is used as a placeholder for resources that are not currently provided
 def _integrate_resources(ioc_container, fast_retrieval_context, payload):
-    if not hasattr(fast_retrieval_context, 'resources'):
-        fast_retrieval_context.resources = []
-
-    handles_to_resources = {
-        get_fast_retrieval_resource_handle(ioc_container, resource_name): getattr(payload, resource_name)
-        for resource_name in ioc_container.provides}
+    # Extract everything before touching the context, so a payload which fails extraction leaves nothing behind
+    (_, handles, extractor) = ioc_container._arming_plan()
+    resources = ioc_container._extract_resources(extractor, payload)
 
-    max_handle = max(handles_to_resources)
-    current_length = len(fast_retrieval_context.resources)
-    if max_handle >= current_length:
-        fast_retrieval_context.resources.extend([fast_retrieval_context] * (1 + max_handle - current_length))
+    ensure_resources_length(fast_retrieval_context)
 
-    for handle, resource in handles_to_resources.iteritems():
+    for handle, resource in zip(handles, resources):
         assert fast_retrieval_context.resources[handle] is fast_retrieval_context
         fast_retrieval_context.resources[handle] = resource
 
+
 # fast_retrieval_context is used as a placeholder for resources that are not currently provided
 def _cleanup_resources(ioc_container, fast_retrieval_context):
-    for resource_name in ioc_container.provides:
-        handle = get_fast_retrieval_resource_handle(ioc_container, resource_name)
+    # Usage only grows, so the current plan also covers slots filled by mark_used while the container was armed
+    for handle in ioc_container._arming_plan()[1]:
         fast_retrieval_context.resources[handle] = fast_retrieval_context
 
 
-def create_ioc_container(injected_resource_type, allow_idempotent_arming=False):
-    # type: (type, bool)->InstanceIOCContainer
+def _disarm_all_after_fork():
+    # Only the forking thread survives a fork, so its thread locals are the only armed state left to reset
+    _STRUCTURED_LOCAL.__dict__.clear()
+    _clear_accounting_scopes()
+    fast_retrieval_context = get_fast_retrieval_context()
+    resources = fast_retrieval_context.resources
+    resources[:] = [fast_retrieval_context] * len(resources)
+
+
+# Merged handle vectors of container combinations armed together by arm_all, see _MultiArming
+_MERGED_HANDLES = {}  # type: Dict[Tuple[Tuple[ArmableIOCContainer, ...], Tuple[int, ...]], Tuple[int, ...]]
+_MERGED_HANDLES_LIMIT = 1024
+
+
+def _merged_handles(ioc_containers, plans):
+    # type: (Tuple[ArmableIOCContainer, ...], List[Tuple[int, Tuple[int, ...], Callable]]) -> Tuple[int, ...]
+    key = (ioc_containers, tuple(generation for (generation, _, _) in plans))
+    result = _MERGED_HANDLES.get(key)
+    if result is None:
+        if len(_MERGED_HANDLES) >= _MERGED_HANDLES_LIMIT:
+            _MERGED_HANDLES.clear()
+        result = _MERGED_HANDLES[key] = tuple(handle for (_, handles, _) in plans for handle in handles)
+    return result
+
+
+class _MultiArming(object):
+    __slots__ = ('_payloads', '_armed_containers', '_armed_handles', '_usage_generation')
+
+    def __init__(self, payloads):
+        # type: (Dict[ArmableIOCContainer, Any]) -> None
+        self._payloads = payloads
+        self._armed_containers = ()  # type: Tuple[ArmableIOCContainer, ...]
+        self._armed_handles = ()  # type: Tuple[int, ...]
+        self._usage_generation = 0
+
+    def __enter__(self):
+        armed_payloads = _STRUCTURED_LOCAL.__dict__
+        self._usage_generation = get_resources_usage_generation()
+
+        # Everything which may fail happens before the first slot is written
+        to_arm = []
+        plans = []
+        resources = []
+        samples = []
+        for (ioc_container, payload) in self._payloads.iteritems():
+            ioc_container._validate_payload(payload)
+            existing = armed_payloads.get(ioc_container)
+            if existing is not None:
+                if ioc_container.allow_idempotent_arming and existing is payload:
+                    continue  # Whoever armed it first will disarm it
+                raise CannotArmTwice()
+            to_arm.append(ioc_container)
+            plan = ioc_container._arming_plan()
+            plans.append(plan)
+            resources.extend(ioc_container._extract_resources(plan[2], payload))
+            if ioc_container.accounting is not None:
+                samples.append((ioc_container, ioc_container.accounting._sample(payload)))
+
+        armed_containers = tuple(to_arm)
+        armed_handles = _merged_handles(armed_containers, plans)
+
+        fast_retrieval_context = get_fast_retrieval_context()
+        ensure_resources_length(fast_retrieval_context)
+        context_resources = fast_retrieval_context.resources
+        for (handle, resource) in zip(armed_handles, resources):
+            context_resources[handle] = resource
+        for ioc_container in armed_containers:
+            armed_payloads[ioc_container] = self._payloads[ioc_container]
+        for (ioc_container, sample) in samples:
+            ioc_container.accounting._start(ioc_container, sample)
+
+        self._armed_containers = armed_containers
+        self._armed_handles = armed_handles
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        armed_payloads = _STRUCTURED_LOCAL.__dict__
+        for ioc_container in self._armed_containers:
+            if armed_payloads.pop(ioc_container, None) is None:
+                return  # All disarmed at once by reset_after_fork
+
+        armed_handles = self._armed_handles
+        if get_resources_usage_generation() != self._usage_generation:  # Slots may have been filled by mark_used
+            armed_handles = tuple(handle for ioc_container in self._armed_containers
+                                  for handle in ioc_container._arming_plan()[1])
+
+        fast_retrieval_context = get_fast_retrieval_context()
+        context_resources = fast_retrieval_context.resources
+        for handle in armed_handles:
+            context_resources[handle] = fast_retrieval_context
+        for ioc_container in self._armed_containers:
+            if ioc_container.accounting is not None:
+                ioc_container.accounting._stop(ioc_container)
+
+
+def arm_all(payloads):
+    # type: (Dict[ArmableIOCContainer, Any]) -> _MultiArming
+    """
+    Arms several containers at once, e.g. `with arm_all({CONFIG: config, AUTH: auth}):`.
+    All payloads are validated and read before anything is armed, so either all containers are armed or none is.
+    Containers allowing idempotent arming which are already armed with the same payload are left as they are.
+    """
+    return _MultiArming(payloads)
+
+
+def create_ioc_container(injected_resource_type, allow_idempotent_arming=False, accounting=None, parent=None,
+                         arm_used_resources_only=False):
+    # type: (type, bool, Optional[ArmedAccounting], Optional[IOCContainer], bool)->InstanceIOCContainer
+    """
+    accounting, an ArmedAccounting, records the time spent in each armed scope of the container.
+    parent is a container whose resources are injected along with this container's, this container's own resources
+    shadowing its parent's while it is armed (e.g. request settings over global ones).
+    arm_used_resources_only makes arming skip the resources no decorated callable reads, see ArmableIOCContainer.
+    """
     result = InstanceIOCContainer(injected_resource_type,
-                                  allow_idempotent_arming)
+                                  allow_idempotent_arming,
+                                  accounting,
+                                  parent,
+                                  arm_used_resources_only)
     register_ioc_container(result)
     return result
@@ -0,0 +1,76 @@
+import attr
+from typing import Any, Callable, Dict, List
+
+
+def _has_generated_init(payload_type):
+    # type: (type) -> bool
+    init_function = getattr(payload_type.__init__, 'im_func', None)
+    code = getattr(init_function, 'func_code', None)
+    return code is not None and code.co_filename.startswith('<attrs generated init')
+
+
+def _is_recyclable(payload_type):
+    # type: (type) -> bool
+    # Recycled instances are filled with setattr, bypassing __init__. That is only equivalent to construction when
+    # nothing would have run in between: an __init__ generated by attrs with no __attrs_post_init__, and no
+    # custom/frozen __setattr__, validators or converters.
+    if payload_type.__setattr__ is not object.__setattr__:
+        return False
+    if not _has_generated_init(payload_type) or hasattr(payload_type, '__attrs_post_init__'):
+        return False
+    return all(field.validator is None and
+               getattr(field, 'converter', getattr(field, 'convert', None)) is None
+               for field in attr.fields(payload_type))
+
+
+class PooledPayloadFactory(object):
+    """
+    Builds attrs payloads from per-request values, recycling released instances from a free-list when the type
+    allows it (see _is_recyclable). Types which do not allow it are constructed normally on every call.
+
+    values_factory receives the request (e.g. a WSGI environ) and returns a mapping of field name to value; fields
+    which are not returned get their attrs default.
+
+    A released payload has its fields cleared and is handed out again for a later request: nothing may keep a
+    reference to it (e.g. from `container.provided`) past the request it was built for, or it would see another
+    request's data.
+    """
+
+    def __init__(self, payload_type, values_factory, max_free=64):
+        # type: (type, Callable[[Any], Dict[basestring, Any]], int) -> None
+        self.payload_type = payload_type
+        self.values_factory = values_factory
+        self.max_free = max_free
+        self.recyclable = _is_recyclable(payload_type)
+        self._fields = tuple((field.name, field.default) for field in attr.fields(payload_type))
+        self._free = []  # type: List[Any]
+
+    def __call__(self, request):
+        values = self.values_factory(request)
+        if not self.recyclable:
+            return self.payload_type(**values)
+
+        try:
+            payload = self._free.pop()
+        except IndexError:
+            payload = self.payload_type.__new__(self.payload_type)
+
+        for (name, default) in self._fields:
+            if name in values:
+                value = values[name]
+            elif isinstance(default, attr.Factory):
+                value = default.factory(payload) if getattr(default, 'takes_self', False) else default.factory()
+            elif default is attr.NOTHING:
+                raise TypeError('Missing value for field {} of {}'.format(name, self.payload_type))
+            else:
+                value = default
+            setattr(payload, name, value)
+        return payload
+
+    def release(self, payload):
+        if not self.recyclable or len(self._free) >= self.max_free:
+            return
+        # Drop references held by the payload, so a pooled instance does not keep request data alive
+        for (name, _) in self._fields:
+            setattr(payload, name, None)
+        self._free.append(payload)
@@ -0,0 +1,30 @@
+"""
+Support for prefork servers (gunicorn, uwsgi, ...).
+
+Workers inherit whatever was armed in the parent at fork time; reset_after_fork() disarms it. It is registered with
+os.register_at_fork where available (Python 3.7+), otherwise it should be called from the server's post-fork hook.
+
+prepare_for_fork() should be called in the parent once all containers are created and modules are imported. It
+compacts the registry into an immutable form and, where available, moves everything allocated so far out of the
+garbage collector's reach (gc.freeze), so workers do not dirty the pages they share with the parent.
+"""
+import gc
+import os
+
+from roro_ioc.container_field_registry import freeze_registry
+from roro_ioc.instance_ioc_container import _disarm_all_after_fork
+
+
+def reset_after_fork():
+    _disarm_all_after_fork()
+
+
+def prepare_for_fork():
+    freeze_registry()
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
@@ -0,0 +1,83 @@
+from operator import itemgetter, attrgetter
+
+import attr
+from attr.validators import instance_of, optional
+from cached_property import cached_property
+from typing import Any, Callable, FrozenSet, Optional, Tuple
+
+from roro_ioc.accounting import ArmedAccounting
+from roro_ioc.container import IOCContainer
+from roro_ioc.container_field_registry import register_ioc_container
+from roro_ioc.exceptions import InvalidPayload
+from roro_ioc.instance_ioc_container import ArmableIOCContainer, _tuple_getter
+
+# How a SchemaIOCContainer reads its fields out of a payload
+MAPPING_PAYLOAD = 'mapping'  # payload[field_name], e.g. dicts
+SEQUENCE_PAYLOAD = 'sequence'  # payload[field_index], e.g. tuples and namedtuples listing fields in schema order
+ATTRIBUTES_PAYLOAD = 'attributes'  # getattr(payload, field_name), e.g. namedtuples, dataclasses, plain objects
+
+_PAYLOAD_KINDS = frozenset((MAPPING_PAYLOAD, SEQUENCE_PAYLOAD, ATTRIBUTES_PAYLOAD))
+
+
+def _validate_fields(o, a, v):
+    if not v or not all(isinstance(field, basestring) for field in v) or len(set(v)) != len(v):
+        raise ValueError('Fields must be a non-empty tuple of distinct names, got {!r}'.format(v))
+
+
+@attr.attrs(hash=False)
+class SchemaIOCContainer(ArmableIOCContainer):
+    """
+    A container declared from a tuple of field names rather than an attrs type, which arms straight from the data
+    it is given - no payload object needs to be built for it. Payloads are not type checked: a payload is invalid
+    when one of the fields cannot be read out of it.
+    """
+    fields = attr.attrib(validator=[instance_of(tuple), _validate_fields])  # type: Tuple[basestring, ...]
+    payload_kind = attr.attrib(validator=attr.validators.in_(_PAYLOAD_KINDS))  # type: basestring
+    allow_idempotent_arming = attr.attrib(validator=instance_of(bool))  # type: bool
+    accounting = attr.attrib(default=None)  # type: Optional[ArmedAccounting]
+    parent = attr.attrib(default=None, validator=optional(instance_of(IOCContainer)))  # type: Optional[IOCContainer]
+    arm_used_resources_only = attr.attrib(default=False, validator=instance_of(bool))  # type: bool
+
+    @cached_property
+    def provides(self):
+        # type: () -> FrozenSet[basestring]
+        return frozenset(self.fields)
+
+    @property
+    def _resource_names(self):
+        # type: () -> Tuple[basestring, ...]
+        return self.fields
+
+    def _resource_extractor_for(self, resource_names):
+        # type: (Tuple[basestring, ...]) -> Callable[[Any], Tuple[Any, ...]]
+        if self.payload_kind == MAPPING_PAYLOAD:
+            return _tuple_getter(itemgetter, resource_names)
+        elif self.payload_kind == SEQUENCE_PAYLOAD:
+            return _tuple_getter(itemgetter, tuple(self.fields.index(resource_name)
+                                                   for resource_name in resource_names))
+        else:
+            return _tuple_getter(attrgetter, resource_names)
+
+    def _extract_resources(self, extractor, payload):
+        # type: (Callable[[Any], Tuple[Any, ...]], Any) -> Tuple[Any, ...]
+        try:
+            return extractor(payload)
+        except (KeyError, IndexError, AttributeError, TypeError) as e:
+            raise InvalidPayload('Cannot read fields {} from {!r}: {}'.format(self.fields, payload, e))
+
+    def resource_getter(self, resource_name):
+        if self.payload_kind == MAPPING_PAYLOAD:
+            return itemgetter(resource_name)
+        elif self.payload_kind == SEQUENCE_PAYLOAD:
+            return itemgetter(self.fields.index(resource_name))
+        else:
+            return attrgetter(resource_name)
+
+
+def create_schema_ioc_container(fields, payload_kind=MAPPING_PAYLOAD, allow_idempotent_arming=False, accounting=None,
+                                parent=None, arm_used_resources_only=False):
+    # type: (Tuple[basestring, ...], basestring, bool, Optional[ArmedAccounting], Optional[IOCContainer], bool)->SchemaIOCContainer
+    result = SchemaIOCContainer(tuple(fields), payload_kind, allow_idempotent_arming, accounting, parent,
+                                arm_used_resources_only)
+    register_ioc_container(result)
+    return result
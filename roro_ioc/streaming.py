@@ -0,0 +1,61 @@
+"""
+Helpers for lazy streaming pipelines built out of injected generators.
+
+Injected generator functions resolve their resources when they are called, not when they are first iterated (see
+build_injecting_shim). A pipeline of such stages therefore only needs its containers armed while it is assembled:
+
+    with TENANT_CONTAINER.arm(tenant):
+        rows = chain_stages(read_rows(path), parse, enrich, serialize)
+    for row in rows:  # No longer armed, and does not need to be
+        ...
+
+Stages which call other injected functions for every item do need an armed context while they are iterated;
+carry_armed() captures the payloads armed at call time and arms them once around the whole iteration.
+"""
+from typing import Callable, Iterable, Iterator, Tuple
+
+from roro_ioc.exceptions import NoValuesProvided
+from roro_ioc.instance_ioc_container import InstanceIOCContainer
+
+
+def chain_stages(source, *stages):
+    # type: (Iterable, *Callable[[Iterable], Iterable]) -> Iterable
+    """
+    Feeds source through stages, each called with the previous one's output. All stages are called immediately,
+    so injected generator stages capture the resources armed now.
+    """
+    result = source
+    for stage in stages:
+        result = stage(result)
+    return result
+
+
+def carry_armed(iterable, *containers):
+    # type: (Iterable, *InstanceIOCContainer) -> Iterator
+    """
+    Returns an iterator over iterable which re-arms containers with the payloads they are armed with now, once for
+    the whole iteration rather than once per item. Containers which are still armed with the same payloads when
+    iteration happens are left alone.
+
+    The iterator has to be consumed (or closed) on a single thread, as arming is thread local.
+    """
+    payloads = tuple((container, container.provided) for container in containers)
+    for (container, payload) in payloads:
+        if payload is None:
+            raise NoValuesProvided('Container {} is not armed'.format(container))
+    return _iterate_armed(iter(iterable), payloads)
+
+
+def _iterate_armed(iterator, payloads):
+    # type: (Iterator, Tuple[Tuple[InstanceIOCContainer, object], ...]) -> Iterator
+    armed = []
+    try:
+        # One at a time, so a container that cannot be armed leaves only the ones before it to disarm
+        for (container, payload) in payloads:
+            if container.provided is not payload and container._arm(payload):
+                armed.append(container)
+        for item in iterator:
+            yield item
+    finally:
+        for container in reversed(armed):
+            container._disarm()
@@ -0,0 +1,100 @@
+from timeit import default_timer
+
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple
+
+from roro_ioc.instance_ioc_container import InstanceIOCContainer
+
+ARM_LATENCY_ENVIRON_KEY = 'roro_ioc.arm_latency'
+
+
+def _release(payload_factory, payload):
+    release = getattr(payload_factory, 'release', None)
+    if release is not None:
+        release(payload)
+
+
+class _ArmedResponse(object):
+    """
+    Keeps the containers armed while the server consumes the response body, and disarms them on close() -
+    which PEP 333 requires servers to call, on the thread that served the request.
+
+    The length of a sized body is forwarded (see _SizedArmedResponse), so servers can still set Content-Length. A body
+    returned by wsgi.file_wrapper is wrapped like any other, so servers stream it instead of using sendfile.
+    """
+
+    def __init__(self, result, armed):
+        self._result = result  # type: Iterable[bytes]
+        self._armed = armed  # type: List[Tuple[InstanceIOCContainer, Any, Any]]
+
+    def __iter__(self):
+        return iter(self._result)
+
+    def close(self):
+        try:
+            close = getattr(self._result, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            _disarm_all(self._armed)
+
+
+class _SizedArmedResponse(_ArmedResponse):
+    def __len__(self):
+        return len(self._result)
+
+
+def _disarm_all(armed):
+    # Reverse order of arming, like nested `with` blocks would
+    while armed:
+        (container, payload_factory, payload) = armed.pop()
+        container._disarm()
+        _release(payload_factory, payload)
+
+
+class ArmingMiddleware(object):
+    """
+    WSGI middleware which arms containers for the duration of each request, replacing hand-written
+    `with container.arm(...)` blocks around handlers.
+
+    payload_factories is a sequence of (container, factory) pairs. Each factory is called with the WSGI environ and
+    returns the payload to arm its container with. If the factory has a release(payload) method (see
+    PooledPayloadFactory), it is called once the request is over, so the payload can be recycled.
+
+    The time spent building payloads and arming is stored in the environ under ARM_LATENCY_ENVIRON_KEY, and passed
+    to latency_callback if one is given.
+    """
+
+    def __init__(self, application, payload_factories, latency_callback=None):
+        # type: (Callable, Sequence[Tuple[InstanceIOCContainer, Callable[[dict], Any]]], Optional[Callable[[float], None]]) -> None
+        self.application = application
+        self.payload_factories = tuple(payload_factories)
+        self.latency_callback = latency_callback
+
+    def __call__(self, environ, start_response):
+        start = default_timer()
+        armed = []  # type: List[Tuple[InstanceIOCContainer, Any, Any]]
+        try:
+            for (container, payload_factory) in self.payload_factories:
+                payload = payload_factory(environ)
+                if container._arm(payload):
+                    armed.append((container, payload_factory, payload))
+                else:  # Idempotent arming, whoever armed it first will disarm it
+                    _release(payload_factory, payload)
+        except:
+            _disarm_all(armed)
+            raise
+
+        latency = default_timer() - start
+        environ[ARM_LATENCY_ENVIRON_KEY] = latency
+        if self.latency_callback is not None:
+            self.latency_callback(latency)
+
+        try:
+            result = self.application(environ, start_response)
+        except:
+            _disarm_all(armed)
+            raise
+
+        if hasattr(result, '__len__'):
+            return _SizedArmedResponse(result, armed)
+        return _ArmedResponse(result, armed)
@@ -21,6 +21,5 @@ setup(
         'attrs',
         'typing',
         'cached_property',
-        'werkzeug',
     ]
 )
@@ -0,0 +1,12 @@
+import attr
+
+from roro_ioc import create_ioc_container
+
+
+@attr.attrs
+class FixtureParameters(object):
+    database = attr.attrib()
+    tracer = attr.attrib()
+
+
+FIXTURE_CONTAINER = create_ioc_container(FixtureParameters)
@@ -0,0 +1 @@
+raise ImportError('This module is broken on purpose')
@@ -0,0 +1,23 @@
+from roro_ioc import inject, INJECTED
+
+from _audit_fixture import FIXTURE_CONTAINER
+
+
+@inject(FIXTURE_CONTAINER)
+def query(sql, database=INJECTED):
+    return database, sql
+
+
+@inject(FIXTURE_CONTAINER)
+def stream(sql, database=INJECTED):
+    yield database, sql
+
+
+@inject(FIXTURE_CONTAINER)
+class Repository(object):
+    def __init__(self, database=INJECTED, tracer=INJECTED):
+        self.database = database
+
+
+def not_injected(x):
+    return x
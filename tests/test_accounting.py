@@ -0,0 +1,79 @@
+import threading
+from operator import attrgetter, itemgetter
+from StringIO import StringIO
+from unittest import TestCase
+
+import attr
+
+from roro_ioc import create_ioc_container, create_schema_ioc_container, inject, INJECTED, arm_all, ArmedAccounting, \
+    UsageTable
+from roro_ioc.accounting import OVERFLOW_LABEL, thread_time
+
+
+@attr.attrs
+class Tenant(object):
+    tenant_name = attr.attrib()
+
+
+TENANT_ACCOUNTING = ArmedAccounting(attrgetter('tenant_name'))
+TENANT_CONTAINER = create_ioc_container(Tenant, accounting=TENANT_ACCOUNTING)
+REGION_ACCOUNTING = ArmedAccounting(itemgetter('region'), UsageTable(max_labels=1))
+REGION_CONTAINER = create_schema_ioc_container(('region',), accounting=REGION_ACCOUNTING)
+
+
+@inject(TENANT_CONTAINER)
+def _tenant_name(tenant_name=INJECTED):
+    return tenant_name
+
+
+def _burn_cpu(seconds):
+    start = thread_time()
+    while thread_time() - start < seconds:
+        pass
+
+
+class TestArmedAccounting(TestCase):
+    def setUp(self):
+        TENANT_ACCOUNTING.table.reset()
+        REGION_ACCOUNTING.table.reset()
+
+    def test_records_armed_scopes(self):
+        for tenant_name in ('acme', 'acme', 'other'):
+            with TENANT_CONTAINER.arm(Tenant(tenant_name)):
+                self.assertEqual(tenant_name, _tenant_name())
+                _burn_cpu(0.01)
+
+        usage = TENANT_ACCOUNTING.table.snapshot()
+        self.assertEqual({'acme', 'other'}, set(usage))
+        self.assertEqual(2, usage['acme'].count)
+        self.assertEqual(1, usage['other'].count)
+        self.assertGreaterEqual(usage['acme'].cpu_seconds, 0.02)
+        self.assertGreaterEqual(usage['acme'].wall_seconds, usage['acme'].cpu_seconds * 0.5)
+
+    def test_cpu_of_other_threads_is_not_counted(self):
+        with TENANT_CONTAINER.arm(Tenant('acme')):
+            thread = threading.Thread(target=_burn_cpu, args=(0.05,))
+            thread.start()
+            thread.join()
+        self.assertLess(TENANT_ACCOUNTING.table.snapshot()['acme'].cpu_seconds, 0.04)
+
+    def test_overflow(self):
+        for region in ('eu', 'us', 'ap'):
+            with REGION_CONTAINER.arm({'region': region}):
+                pass
+        usage = REGION_ACCOUNTING.table.snapshot()
+        self.assertEqual(1, usage['eu'].count)
+        self.assertEqual(2, usage[OVERFLOW_LABEL].count)
+
+    def test_arm_all(self):
+        with arm_all({TENANT_CONTAINER: Tenant('acme'), REGION_CONTAINER: {'region': 'eu'}}):
+            pass
+        self.assertEqual(1, TENANT_ACCOUNTING.table.snapshot()['acme'].count)
+        self.assertEqual(1, REGION_ACCOUNTING.table.snapshot()['eu'].count)
+
+    def test_dump(self):
+        with TENANT_CONTAINER.arm(Tenant('acme')):
+            pass
+        output = StringIO()
+        TENANT_ACCOUNTING.table.dump(output)
+        self.assertTrue(output.getvalue().startswith('acme '))
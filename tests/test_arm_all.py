@@ -0,0 +1,71 @@
+from unittest import TestCase
+
+import attr
+
+from roro_ioc import arm_all, create_ioc_container, create_schema_ioc_container, inject, INJECTED, NoValuesProvided
+from roro_ioc.exceptions import CannotArmTwice, InvalidPayload
+
+
+@attr.attrs
+class ConfigParameters(object):
+    region = attr.attrib()
+
+
+@attr.attrs
+class AuthParameters(object):
+    user = attr.attrib()
+
+
+CONFIG_CONTAINER = create_ioc_container(ConfigParameters)
+AUTH_CONTAINER = create_ioc_container(AuthParameters, allow_idempotent_arming=True)
+TENANT_CONTAINER = create_schema_ioc_container(('tenant',))
+
+
+@inject(CONFIG_CONTAINER, AUTH_CONTAINER, TENANT_CONTAINER)
+def _describe(region=INJECTED, user=INJECTED, tenant=INJECTED):
+    return '{}/{}/{}'.format(region, user, tenant)
+
+
+class TestArmAll(TestCase):
+    def test_arm_all(self):
+        config = ConfigParameters('eu')
+        with arm_all({CONFIG_CONTAINER: config,
+                      AUTH_CONTAINER: AuthParameters('alice'),
+                      TENANT_CONTAINER: {'tenant': 'acme'}}):
+            self.assertEqual('eu/alice/acme', _describe())
+            self.assertIs(config, CONFIG_CONTAINER.provided)
+
+        for container in (CONFIG_CONTAINER, AUTH_CONTAINER, TENANT_CONTAINER):
+            self.assertIsNone(container.provided)
+        with self.assertRaises(NoValuesProvided):
+            _describe()
+
+    def test_all_or_nothing(self):
+        with self.assertRaises(InvalidPayload):
+            with arm_all({CONFIG_CONTAINER: ConfigParameters('eu'),
+                          AUTH_CONTAINER: AuthParameters('alice'),
+                          TENANT_CONTAINER: {'not_tenant': 'acme'}}):
+                pass
+        with self.assertRaises(InvalidPayload):
+            with arm_all({CONFIG_CONTAINER: AuthParameters('eu'), AUTH_CONTAINER: AuthParameters('alice')}):
+                pass
+        self.assertIsNone(CONFIG_CONTAINER.provided)
+        self.assertIsNone(AUTH_CONTAINER.provided)
+
+    def test_already_armed(self):
+        with CONFIG_CONTAINER.arm(ConfigParameters('eu')):
+            with self.assertRaises(CannotArmTwice):
+                with arm_all({CONFIG_CONTAINER: ConfigParameters('us'), AUTH_CONTAINER: AuthParameters('alice')}):
+                    pass
+            self.assertIsNone(AUTH_CONTAINER.provided)
+            self.assertEqual('eu', CONFIG_CONTAINER.provided.region)
+
+    def test_idempotent(self):
+        auth = AuthParameters('alice')
+        with AUTH_CONTAINER.arm(auth):
+            with arm_all({CONFIG_CONTAINER: ConfigParameters('eu'),
+                          AUTH_CONTAINER: auth,
+                          TENANT_CONTAINER: {'tenant': 'acme'}}):
+                self.assertEqual('eu/alice/acme', _describe())
+            self.assertIs(auth, AUTH_CONTAINER.provided)
+            self.assertIsNone(CONFIG_CONTAINER.provided)
@@ -0,0 +1,46 @@
+import json
+from StringIO import StringIO
+from unittest import TestCase, skipIf
+
+import sys
+
+from roro_ioc import audit
+from roro_ioc.inject import ENGINE_REWRITE_AST, ENGINE_GENERATOR_SHIM, ENGINE_WRAPPING, _USE_WRAPPING_INJECTOR
+
+
+class TestAudit(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Decoration happens once, on import, so the fixture package is audited once for all tests
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            cls.exit_code = audit.main(['--json', '--min-fast-path-coverage', '70', '_audit_fixture'])
+            cls.output = json.loads(sys.stdout.getvalue())
+        finally:
+            sys.stdout = stdout
+
+    @skipIf(_USE_WRAPPING_INJECTOR, 'TWG_WRAPPING_INJECTOR forces the wrapping engine')
+    def test_callables(self):
+        callables = {entry['name']: entry for entry in self.output['callables']}
+        self.assertEqual({'_audit_fixture.injected.query': ENGINE_REWRITE_AST,
+                          '_audit_fixture.injected.stream': ENGINE_GENERATOR_SHIM,
+                          '_audit_fixture.injected.Repository': ENGINE_WRAPPING},
+                         {name: entry['engine'] for (name, entry) in callables.iteritems()})
+
+        repository = callables['_audit_fixture.injected.Repository']
+        self.assertEqual('not a function', repository['reason'])
+        self.assertFalse(repository['fast_path'])
+        self.assertItemsEqual([{'argument': 'database', 'resource': 'database'},
+                               {'argument': 'tracer', 'resource': 'tracer'}],
+                              repository['injected_arguments'])
+        self.assertEqual(['_audit_fixture.FixtureParameters'], repository['containers'])
+        self.assertGreater(repository['decoration_ms'], 0)
+
+    def test_import_errors(self):
+        self.assertEqual(['_audit_fixture.broken'], [error['module'] for error in self.output['import_errors']])
+
+    @skipIf(_USE_WRAPPING_INJECTOR, 'TWG_WRAPPING_INJECTOR forces the wrapping engine')
+    def test_coverage_threshold(self):
+        self.assertAlmostEqual(200.0 / 3, self.output['summary']['fast_path_coverage'])
+        self.assertEqual(1, self.exit_code)
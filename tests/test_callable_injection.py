@@ -0,0 +1,141 @@
+from collections import OrderedDict
+from functools import partial
+from unittest import TestCase, skipIf
+
+import attr
+
+from roro_ioc import create_ioc_container, inject, INJECTED, NoValuesProvided
+from roro_ioc.factory_inspection import extract_factory_specification
+from roro_ioc.inject import add_decoration_listener, remove_decoration_listener, ENGINE_CALL_SHIM, ENGINE_WRAPPING, \
+    _USE_WRAPPING_INJECTOR
+
+
+@attr.attrs
+class CallParameters(object):
+    scale = attr.attrib()
+    offset = attr.attrib()
+
+
+CALL_CONTAINER = create_ioc_container(CallParameters)
+
+
+def _compute(value, scale=INJECTED, offset=INJECTED):
+    return value * scale + offset
+
+
+class _Computer(object):
+    def __init__(self, base):
+        self.base = base
+
+    def __call__(self, value, scale=INJECTED):
+        return self.base + value * scale
+
+
+class _Parameter(object):
+    """Mimics inspect.Parameter, as Python 2 has no inspect.signature."""
+    POSITIONAL_ONLY, POSITIONAL_OR_KEYWORD, VAR_POSITIONAL, KEYWORD_ONLY, VAR_KEYWORD = range(5)
+    empty = object()
+
+    def __init__(self, name, kind, default=empty):
+        self.name = name
+        self.kind = kind
+        self.default = default
+
+
+class _Signature(object):
+    def __init__(self, *parameters):
+        self.parameters = OrderedDict((parameter.name, parameter) for parameter in parameters)
+
+
+class _SignatureOnly(object):
+    """Like a C or Cython function: no argspec, only __signature__."""
+    __signature__ = _Signature(_Parameter('value', _Parameter.POSITIONAL_OR_KEYWORD),
+                               _Parameter('offset', _Parameter.KEYWORD_ONLY, INJECTED))
+
+    def __call__(self, *args, **kwargs):
+        return args, kwargs
+
+
+class _SignatureOnlyDescriptor(_SignatureOnly):
+    """Like a Cython binding function, which binds as a method but has no func_globals."""
+
+    def __get__(self, instance, owner):
+        return self if instance is None else partial(self, instance)
+
+
+_RECORDS = []
+add_decoration_listener(_RECORDS.append)
+_injected_partial = inject(CALL_CONTAINER)(partial(_compute, 2))
+_injected_keyword_partial = inject(CALL_CONTAINER)(partial(_compute, scale=10))
+_injected_callable = inject(CALL_CONTAINER)(_Computer(100))
+_injected_signature_only = inject(CALL_CONTAINER)(_SignatureOnly())
+_injected_signature_only_descriptor = inject(CALL_CONTAINER)(_SignatureOnlyDescriptor())
+remove_decoration_listener(_RECORDS.append)
+
+
+class TestSpecification(TestCase):
+    def test_partial(self):
+        specification = extract_factory_specification(partial(_compute, 2, offset=1))
+        self.assertEqual(('scale', 'offset'), specification.argument_names)
+        self.assertEqual({'scale': INJECTED, 'offset': 1}, specification.argument_default_values)
+        self.assertEqual(frozenset(['offset']), specification.keyword_only_names)
+
+    def test_callable_object(self):
+        specification = extract_factory_specification(_Computer(1))
+        self.assertEqual(('value', 'scale'), specification.argument_names)
+
+    def test_signature(self):
+        specification = extract_factory_specification(_SignatureOnly())
+        self.assertEqual(('value', 'offset'), specification.argument_names)
+        self.assertEqual(frozenset(['offset']), specification.keyword_only_names)
+
+    def test_not_introspectable(self):
+        specification = extract_factory_specification(len)
+        self.assertEqual((), specification.argument_names)
+
+
+class TestCallShim(TestCase):
+    @skipIf(_USE_WRAPPING_INJECTOR, 'TWG_WRAPPING_INJECTOR forces the wrapping engine')
+    def test_engine(self):
+        self.assertEqual([ENGINE_CALL_SHIM] * 5, [record.engine for record in _RECORDS])
+
+    def test_partial(self):
+        with CALL_CONTAINER.arm(CallParameters(3, 1)):
+            self.assertEqual(7, _injected_partial())
+            self.assertEqual(9, _injected_partial(4))
+            self.assertEqual(2 * 3 + 5, _injected_partial(offset=5))
+
+    def test_keyword_partial(self):
+        with CALL_CONTAINER.arm(CallParameters(3, 1)):
+            self.assertEqual(21, _injected_keyword_partial(2))
+            self.assertEqual(9, _injected_keyword_partial(2, scale=4))
+        with self.assertRaises(NoValuesProvided):
+            _injected_keyword_partial(2)
+
+    def test_callable_object(self):
+        with CALL_CONTAINER.arm(CallParameters(3, 1)):
+            self.assertEqual(106, _injected_callable(2))
+        self.assertEqual(104, _injected_callable(2, 2))
+
+    def test_signature_only(self):
+        with CALL_CONTAINER.arm(CallParameters(3, 1)):
+            self.assertEqual(((2,), {'offset': 1}), _injected_signature_only(2))
+
+    def test_signature_only_descriptor(self):
+        with CALL_CONTAINER.arm(CallParameters(3, 1)):
+            self.assertEqual(((2,), {'offset': 1}), _injected_signature_only_descriptor(2))
+
+    def test_keyword_only_after_varargs_is_wrapped(self):
+        class _WithVarargs(_SignatureOnly):
+            __signature__ = _Signature(_Parameter('args', _Parameter.VAR_POSITIONAL),
+                                       _Parameter('offset', _Parameter.KEYWORD_ONLY, INJECTED))
+
+        records = []
+        add_decoration_listener(records.append)
+        try:
+            injected = inject(CALL_CONTAINER)(_WithVarargs())
+        finally:
+            remove_decoration_listener(records.append)
+        self.assertEqual(ENGINE_WRAPPING, records[0].engine)
+        with CALL_CONTAINER.arm(CallParameters(3, 1)):
+            self.assertEqual(((1, 2), {'offset': 1}), injected(1, 2))
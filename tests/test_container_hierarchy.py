@@ -0,0 +1,124 @@
+from unittest import TestCase, skipIf
+
+import attr
+
+from roro_ioc import create_ioc_container, create_schema_ioc_container, inject, INJECTED, INJECTED_IF_AVAILABLE, \
+    NoValuesProvided
+from roro_ioc.exceptions import DoubleProvidingProhibited
+from roro_ioc.inject import add_decoration_listener, remove_decoration_listener, ENGINE_REWRITE_AST, ENGINE_WRAPPING, \
+    _USE_WRAPPING_INJECTOR
+
+
+@attr.attrs
+class GlobalSettings(object):
+    timeout = attr.attrib()
+    region = attr.attrib()
+
+
+@attr.attrs
+class RequestSettings(object):
+    timeout = attr.attrib()
+    user = attr.attrib()
+
+
+GLOBAL_CONTAINER = create_ioc_container(GlobalSettings)
+REQUEST_CONTAINER = create_ioc_container(RequestSettings, parent=GLOBAL_CONTAINER)
+CALL_CONTAINER = create_schema_ioc_container(('timeout',), parent=REQUEST_CONTAINER)
+UNRELATED_CONTAINER = create_schema_ioc_container(('timeout',))
+# Equal to each other field by field, yet distinct containers
+SIBLING_CONTAINER = create_ioc_container(RequestSettings, parent=GLOBAL_CONTAINER)
+SAME_TYPE_CONTAINER = create_ioc_container(GlobalSettings)
+
+_RECORDS = []
+add_decoration_listener(_RECORDS.append)
+
+
+@inject(REQUEST_CONTAINER)
+def _settings(timeout=INJECTED, region=INJECTED, user=INJECTED_IF_AVAILABLE):
+    return timeout, region, user
+
+
+@inject(CALL_CONTAINER)
+def _timeout(timeout=INJECTED):
+    return timeout
+
+
+@inject(REQUEST_CONTAINER)
+class _Settings(object):
+    def __init__(self, timeout=INJECTED, region=INJECTED, user=INJECTED_IF_AVAILABLE):
+        self.settings = (timeout, region, user)
+
+
+remove_decoration_listener(_RECORDS.append)
+
+
+class TestContainerHierarchy(TestCase):
+    @skipIf(_USE_WRAPPING_INJECTOR, 'TWG_WRAPPING_INJECTOR forces the wrapping engine')
+    def test_engines(self):
+        self.assertEqual([ENGINE_REWRITE_AST, ENGINE_REWRITE_AST, ENGINE_WRAPPING],
+                         [record.engine for record in _RECORDS])
+        self.assertEqual({GLOBAL_CONTAINER, REQUEST_CONTAINER}, set(_RECORDS[0].containers))
+
+    def _assert_settings(self, expected):
+        self.assertEqual(expected, _settings())
+        self.assertEqual(expected, _Settings().settings)
+
+    def test_parent_only(self):
+        with GLOBAL_CONTAINER.arm(GlobalSettings(10, 'eu')):
+            self._assert_settings((10, 'eu', None))
+
+    def test_child_shadows_parent(self):
+        with GLOBAL_CONTAINER.arm(GlobalSettings(10, 'eu')):
+            with REQUEST_CONTAINER.arm(RequestSettings(3, 'alice')):
+                self._assert_settings((3, 'eu', 'alice'))
+            self._assert_settings((10, 'eu', None))
+
+    def test_nothing_armed(self):
+        with self.assertRaises(NoValuesProvided):
+            _settings()
+        with self.assertRaises(NoValuesProvided):
+            _Settings()
+
+    def test_grandchild(self):
+        with GLOBAL_CONTAINER.arm(GlobalSettings(10, 'eu')):
+            self.assertEqual(10, _timeout())
+            with CALL_CONTAINER.arm({'timeout': 1}):
+                self.assertEqual(1, _timeout())
+            with REQUEST_CONTAINER.arm(RequestSettings(3, 'alice')):
+                self.assertEqual(3, _timeout())
+                with CALL_CONTAINER.arm({'timeout': 1}):
+                    self.assertEqual(1, _timeout())
+
+    def test_ancestors_may_be_listed(self):
+        @inject(GLOBAL_CONTAINER, REQUEST_CONTAINER)
+        def timeout(timeout=INJECTED):
+            return timeout
+
+        with GLOBAL_CONTAINER.arm(GlobalSettings(10, 'eu')):
+            with REQUEST_CONTAINER.arm(RequestSettings(3, 'alice')):
+                self.assertEqual(3, timeout())
+
+    def test_unrelated_containers_still_conflict(self):
+        with self.assertRaises(DoubleProvidingProhibited):
+            inject(REQUEST_CONTAINER, UNRELATED_CONTAINER)
+
+    def test_containers_of_the_same_type_conflict(self):
+        self.assertEqual(GLOBAL_CONTAINER, SAME_TYPE_CONTAINER)
+        with self.assertRaises(DoubleProvidingProhibited):
+            inject(GLOBAL_CONTAINER, SAME_TYPE_CONTAINER)
+
+    def test_sibling_children_conflict(self):
+        self.assertEqual(REQUEST_CONTAINER, SIBLING_CONTAINER)
+        with self.assertRaises(DoubleProvidingProhibited):
+            inject(REQUEST_CONTAINER, SIBLING_CONTAINER)
+
+    def test_sibling_of_the_same_type_is_injected_from(self):
+        @inject(SIBLING_CONTAINER)
+        def user(user=INJECTED):
+            return user
+
+        with SIBLING_CONTAINER.arm(RequestSettings(3, 'bob')):
+            self.assertEqual('bob', user())
+        with REQUEST_CONTAINER.arm(RequestSettings(3, 'alice')):
+            with self.assertRaises(NoValuesProvided):
+                user()
@@ -0,0 +1,72 @@
+from unittest import TestCase, skipIf
+
+import attr
+
+from roro_ioc import create_ioc_container, inject, INJECTED, INJECTED_IF_AVAILABLE, injected_if_available, \
+    NoValuesProvided, NoSourceForArgument
+from roro_ioc.inject import add_decoration_listener, remove_decoration_listener, ENGINE_REWRITE_AST, ENGINE_WRAPPING, \
+    _USE_WRAPPING_INJECTOR
+
+
+@attr.attrs
+class OptionalParameters(object):
+    cache = attr.attrib()
+    tenant = attr.attrib()
+
+
+OPTIONAL_CONTAINER = create_ioc_container(OptionalParameters)
+
+NULL_CACHE = object()
+
+_ENGINES = []
+add_decoration_listener(_ENGINES.append)
+
+
+@inject(OPTIONAL_CONTAINER)
+def _describe(cache=injected_if_available(NULL_CACHE), tenant=INJECTED_IF_AVAILABLE):
+    return cache, tenant
+
+
+@inject(OPTIONAL_CONTAINER)
+def _mixed(cache=INJECTED_IF_AVAILABLE, tenant=INJECTED):
+    return cache, tenant
+
+
+@inject(OPTIONAL_CONTAINER)
+class _Described(object):
+    def __init__(self, cache=injected_if_available(NULL_CACHE), tenant=INJECTED_IF_AVAILABLE):
+        self.described = (cache, tenant)
+
+
+remove_decoration_listener(_ENGINES.append)
+
+
+class TestOptionalInjection(TestCase):
+    @skipIf(_USE_WRAPPING_INJECTOR, 'TWG_WRAPPING_INJECTOR forces the wrapping engine')
+    def test_engines(self):
+        self.assertEqual([ENGINE_REWRITE_AST, ENGINE_REWRITE_AST, ENGINE_WRAPPING],
+                         [record.engine for record in _ENGINES])
+
+    def test_armed(self):
+        with OPTIONAL_CONTAINER.arm(OptionalParameters('cache', 'acme')):
+            self.assertEqual(('cache', 'acme'), _describe())
+            self.assertEqual(('cache', 'acme'), _Described().described)
+
+    def test_not_armed(self):
+        self.assertEqual((NULL_CACHE, None), _describe())
+        self.assertEqual((NULL_CACHE, None), _Described().described)
+
+    def test_explicit_arguments(self):
+        self.assertEqual((1, 2), _describe(1, tenant=2))
+        self.assertEqual((1, 2), _Described(1, tenant=2).described)
+
+    def test_mandatory_still_raises(self):
+        with self.assertRaises(NoValuesProvided):
+            _mixed()
+        self.assertEqual((None, 'acme'), _mixed(tenant='acme'))
+
+    def test_no_source(self):
+        with self.assertRaises(NoSourceForArgument):
+            @inject(OPTIONAL_CONTAINER)
+            def _misspelt(cache=INJECTED, tennant=INJECTED_IF_AVAILABLE):
+                pass
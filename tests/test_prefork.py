@@ -0,0 +1,103 @@
+import os
+from operator import attrgetter
+from unittest import TestCase
+
+import attr
+
+from roro_ioc import create_ioc_container, inject, INJECTED, NoValuesProvided, reset_after_fork, arm_all
+from roro_ioc.accounting import ArmedAccounting
+from roro_ioc.container_field_registry import _ContainerFieldRegistry, RegistryFrozen
+
+
+@attr.attrs
+class WorkerParameters(object):
+    alpha = attr.attrib()
+    beta = attr.attrib()
+    gamma = attr.attrib()
+
+
+@attr.attrs
+class OtherParameters(object):
+    delta = attr.attrib()
+
+
+WORKER_CONTAINER = create_ioc_container(WorkerParameters)
+OTHER_CONTAINER = create_ioc_container(OtherParameters)
+ACCOUNTING = ArmedAccounting(attrgetter('delta'))
+ACCOUNTED_CONTAINER = create_ioc_container(OtherParameters, accounting=ACCOUNTING)
+
+
+@inject(WORKER_CONTAINER)
+def _alpha(alpha=INJECTED):
+    return alpha
+
+
+class TestFrozenRegistry(TestCase):
+    def setUp(self):
+        self.registry = _ContainerFieldRegistry()
+        self.registry.add(WORKER_CONTAINER)
+        self.registry.add(OTHER_CONTAINER)
+        self.frozen = self.registry.freeze()
+
+    def test_same_handles(self):
+        for (container, names) in ((WORKER_CONTAINER, ('alpha', 'beta', 'gamma')), (OTHER_CONTAINER, ('delta',))):
+            for name in names:
+                self.assertEqual(self.registry.get(container, name), self.frozen.get(container, name))
+
+    def test_unknown_field(self):
+        with self.assertRaises(KeyError):
+            self.frozen.get(WORKER_CONTAINER, 'delta')
+
+    def test_cannot_add(self):
+        with self.assertRaises(RegistryFrozen):
+            self.frozen.add(create_ioc_container(OtherParameters))
+
+
+class TestResetAfterFork(TestCase):
+    def test_reset_after_fork(self):
+        with WORKER_CONTAINER.arm(WorkerParameters(1, 2, 3)):
+            read_end, write_end = os.pipe()
+            pid = os.fork()
+            if pid == 0:  # Child
+                os.close(read_end)
+                reset_after_fork()
+                result = 'armed'
+                if WORKER_CONTAINER.provided is None:
+                    try:
+                        _alpha()
+                    except NoValuesProvided:
+                        result = 'reset'
+                os.write(write_end, result)
+                os._exit(0)
+
+            os.close(write_end)
+            os.waitpid(pid, 0)
+            self.assertEqual('reset', os.read(read_end, 16))
+            os.close(read_end)
+            self.assertEqual(1, _alpha())
+
+    def test_leaving_the_armed_scope_in_the_child(self):
+        read_end, write_end = os.pipe()
+        pid = None
+        try:
+            with ACCOUNTED_CONTAINER.arm(OtherParameters('parent')), \
+                    arm_all({WORKER_CONTAINER: WorkerParameters(1, 2, 3)}):
+                pid = os.fork()
+                if pid == 0:  # Child, leaving both armed scopes normally after the reset
+                    reset_after_fork()
+                    result = 'scopes left' if ACCOUNTING._scopes.__dict__ else 'reset'
+            if pid == 0 and ACCOUNTING.table.snapshot():
+                result = 'charged'
+        except Exception as e:
+            if pid != 0:
+                raise
+            result = type(e).__name__
+        if pid == 0:
+            os.write(write_end, result)
+            os._exit(0)
+
+        os.close(write_end)
+        os.waitpid(pid, 0)
+        self.assertEqual('reset', os.read(read_end, 16))
+        os.close(read_end)
+        self.assertEqual(['parent'], list(ACCOUNTING.table.snapshot()))
@@ -0,0 +1,59 @@
+from collections import namedtuple
+from unittest import TestCase
+
+from roro_ioc import inject, INJECTED, NoValuesProvided
+from roro_ioc.exceptions import InvalidPayload
+from roro_ioc.schema_ioc_container import (create_schema_ioc_container,
+                                           MAPPING_PAYLOAD,
+                                           SEQUENCE_PAYLOAD,
+                                           ATTRIBUTES_PAYLOAD)
+
+_Row = namedtuple('_Row', ('user', 'region'))
+
+MAPPING_CONTAINER = create_schema_ioc_container(('user', 'region'), MAPPING_PAYLOAD)
+SEQUENCE_CONTAINER = create_schema_ioc_container(('account',), SEQUENCE_PAYLOAD)
+ATTRIBUTES_CONTAINER = create_schema_ioc_container(('user', 'region'), ATTRIBUTES_PAYLOAD)
+
+
+@inject(MAPPING_CONTAINER, SEQUENCE_CONTAINER)
+def _describe(user=INJECTED, region=INJECTED, account=INJECTED):
+    return '{}@{}/{}'.format(user, region, account)
+
+
+@inject(ATTRIBUTES_CONTAINER)
+class _Described(object):
+    def __init__(self, user=INJECTED, region=INJECTED):
+        self.description = '{}@{}'.format(user, region)
+
+
+class TestSchemaIOCContainer(TestCase):
+    def test_arm_from_mapping_and_tuple(self):
+        with MAPPING_CONTAINER.arm({'user': 'alice', 'region': 'eu', 'unused': 1}):
+            with SEQUENCE_CONTAINER.arm(('acme',)):
+                self.assertEqual('alice@eu/acme', _describe())
+        with self.assertRaises(NoValuesProvided):
+            _describe()
+
+    def test_arm_from_attributes(self):
+        with ATTRIBUTES_CONTAINER.arm(_Row('bob', 'us')):
+            self.assertEqual('bob@us', _Described().description)  # Goes through the wrapping injector
+
+    def test_sequence_of_namedtuple(self):
+        container = create_schema_ioc_container(('user', 'region'), SEQUENCE_PAYLOAD)
+        with container.arm(_Row('bob', 'us')):
+            self.assertEqual(_Row('bob', 'us'), container.provided)
+
+    def test_invalid_payload_leaves_nothing_armed(self):
+        with self.assertRaises(InvalidPayload):
+            with MAPPING_CONTAINER.arm({'user': 'alice'}):
+                pass
+        self.assertIsNone(MAPPING_CONTAINER.provided)
+        with MAPPING_CONTAINER.arm({'user': 'alice', 'region': 'eu'}):
+            with SEQUENCE_CONTAINER.arm(('acme',)):
+                self.assertEqual('alice@eu/acme', _describe())
+
+    def test_invalid_schema(self):
+        with self.assertRaises(ValueError):
+            create_schema_ioc_container(('user', 'user'))
+        with self.assertRaises(ValueError):
+            create_schema_ioc_container(('user',), 'json')
@@ -0,0 +1,111 @@
+from unittest import TestCase
+
+import attr
+
+from roro_ioc import create_ioc_container, inject, inject_methods, INJECTED, NoValuesProvided
+from roro_ioc.exceptions import CannotArmTwice
+from roro_ioc.streaming import chain_stages, carry_armed
+
+
+@attr.attrs
+class TenantParameters(object):
+    tenant = attr.attrib()
+    multiplier = attr.attrib()
+
+
+TENANT_CONTAINER = create_ioc_container(TenantParameters)
+
+
+@attr.attrs
+class PageParameters(object):
+    page_size = attr.attrib()
+
+
+PAGE_CONTAINER = create_ioc_container(PageParameters)
+
+
+@inject(TENANT_CONTAINER)
+def _tag(rows, tenant=INJECTED):
+    for row in rows:
+        yield (tenant, row)
+
+
+@inject(TENANT_CONTAINER)
+def _multiply(rows, multiplier=INJECTED, *extra, **options):
+    for (tenant, row) in rows:
+        yield (tenant, row * multiplier)
+
+
+@inject(TENANT_CONTAINER)
+def _current_multiplier(multiplier=INJECTED):
+    return multiplier
+
+
+def _multiply_per_item(rows):
+    for row in rows:
+        yield row * _current_multiplier()
+
+
+@inject_methods(TENANT_CONTAINER)
+class _Stage(object):
+    def generate(self, count, tenant=INJECTED):
+        for index in xrange(count):
+            yield (tenant, index)
+
+
+class TestGeneratorInjection(TestCase):
+    def test_resolved_at_call(self):
+        with TENANT_CONTAINER.arm(TenantParameters('acme', 2)):
+            rows = _tag([1, 2])
+        self.assertEqual([('acme', 1), ('acme', 2)], list(rows))
+
+    def test_generator_method(self):
+        with TENANT_CONTAINER.arm(TenantParameters('acme', 2)):
+            rows = _Stage().generate(2)
+        self.assertEqual([('acme', 0), ('acme', 1)], list(rows))
+
+    def test_explicit_argument(self):
+        self.assertEqual([('other', 1)], list(_tag([1], 'other')))
+
+    def test_missing_raises_at_call(self):
+        with self.assertRaises(NoValuesProvided):
+            _tag([1])
+
+    def test_signature_is_kept(self):
+        self.assertEqual('_multiply', _multiply.__name__)
+        with TENANT_CONTAINER.arm(TenantParameters('acme', 3)):
+            rows = _multiply([('x', 1)], option=True)
+        self.assertEqual([('x', 3)], list(rows))
+        self.assertEqual([('x', 4)], list(_multiply([('x', 1)], 4, 'ignored', option=True)))
+
+
+class TestChainStages(TestCase):
+    def test_chain(self):
+        with TENANT_CONTAINER.arm(TenantParameters('acme', 10)):
+            rows = chain_stages(iter([1, 2, 3]), _tag, _multiply)
+        self.assertEqual([('acme', 10), ('acme', 20), ('acme', 30)], list(rows))
+
+
+class TestCarryArmed(TestCase):
+    def test_arms_during_iteration(self):
+        with TENANT_CONTAINER.arm(TenantParameters('acme', 10)):
+            rows = carry_armed(_multiply_per_item([1, 2]), TENANT_CONTAINER)
+        self.assertEqual([10, 20], list(rows))
+        self.assertIsNone(TENANT_CONTAINER.provided)
+
+    def test_consumed_while_still_armed(self):
+        with TENANT_CONTAINER.arm(TenantParameters('acme', 10)):
+            self.assertEqual([10], list(carry_armed(_multiply_per_item([1]), TENANT_CONTAINER)))
+            self.assertIsNotNone(TENANT_CONTAINER.provided)
+
+    def test_requires_armed_container(self):
+        with self.assertRaises(NoValuesProvided):
+            carry_armed([], TENANT_CONTAINER)
+
+    def test_failed_arming_disarms_the_others(self):
+        with TENANT_CONTAINER.arm(TenantParameters('acme', 10)), PAGE_CONTAINER.arm(PageParameters(50)):
+            rows = carry_armed(iter([1]), TENANT_CONTAINER, PAGE_CONTAINER)
+        with PAGE_CONTAINER.arm(PageParameters(20)):
+            with self.assertRaises(CannotArmTwice):
+                list(rows)
+            self.assertIsNone(TENANT_CONTAINER.provided)
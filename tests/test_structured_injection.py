@@ -1,5 +1,6 @@
-from traceback import format_stack
-from unittest import TestCase, skip
+import sys
+from traceback import format_stack, extract_tb
+from unittest import TestCase, skipIf
 
 import attr
 from cached_property import cached_property
@@ -9,7 +10,8 @@ from roro_ioc import (NoSourceForArgument,
                       inject_methods,
                       inject_methods_,
                       NoValuesProvided,
-                      INJECTED, inject_)
+                      INJECTED, inject_, inject)
+from roro_ioc.inject import _USE_WRAPPING_INJECTOR
 
 
 @attr.attrs
@@ -67,8 +69,34 @@ class MockWithMangledNames(object):
         return 0
 
 
+class _BaseWithMangledNames(object):
+    def foo(self, a=INJECTED):
+        return self.__foo() + a
+
+    def __foo(self):
+        return 10
+
+
+@inject_methods(TEST_PARAMETERS_IOC_CONTAINER)
+class InheritingMangledNames(_BaseWithMangledNames):
+    pass
+
+
+class InjectInClassBody(object):
+    @inject(TEST_PARAMETERS_IOC_CONTAINER)
+    def foo(self, a=INJECTED):
+        return (lambda: self.__foo())() + a
+
+    def __foo(self):
+        return 20
+
+
+@inject(TEST_PARAMETERS_IOC_CONTAINER)
+def _raise_with_a(a=INJECTED):
+    raise ValueError(a)
+
+
 class TestErrorHandling(TestCase):
-    @skip("TODO: the wrong exception is raised because no injector was ever armed")
     def test_no_values_provided_first_injection(self):
         a = AppliedInjection()
         with self.assertRaises(NoValuesProvided):
@@ -159,6 +187,25 @@ class TestStructuredInjection(TestCase):
         with self._arm():
             self.assertEqual(2, __MockWithMangledNames().foo())
 
+    def test_injected_mangled_name_of_base_class(self):
+        with self._arm():
+            self.assertEqual(12, InheritingMangledNames().foo())
+
+    def test_injected_mangled_name_in_class_body(self):
+        with self._arm():
+            self.assertEqual(22, InjectInClassBody().foo())
+
+    @skipIf(_USE_WRAPPING_INJECTOR, 'TWG_WRAPPING_INJECTOR forces the wrapping engine')
+    def test_line_numbers_are_kept(self):
+        with self._arm():
+            try:
+                _raise_with_a()
+            except ValueError:
+                (_, line_number, function_name, line) = extract_tb(sys.exc_info()[2])[-1]
+        self.assertEqual('_raise_with_a', function_name)
+        self.assertEqual('raise ValueError(a)', line)
+        self.assertEqual(_raise_with_a.func_code.co_firstlineno + 2, line_number)
+
     def test_not_injecting_when_default_is_none(self):
         @inject_(TEST_PARAMETERS_IOC_CONTAINER)
         def foo(a=None):
@@ -0,0 +1,109 @@
+import threading
+from unittest import TestCase
+
+import attr
+
+from roro_ioc import create_ioc_container, inject, INJECTED, NoValuesProvided, injected_if_available
+from roro_ioc.container_field_registry import _ContainerFieldRegistry, get_fast_retrieval_context
+
+
+@attr.attrs
+class ThreadParameters(object):
+    first = attr.attrib()
+    second = attr.attrib()
+
+
+THREAD_CONTAINER = create_ioc_container(ThreadParameters)
+
+
+@inject(THREAD_CONTAINER)
+def _sum(first=INJECTED, second=INJECTED):
+    return first + second
+
+
+def _run_in_threads(count, target):
+    threads = [threading.Thread(target=target, args=(index,)) for index in xrange(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class TestConcurrentRegistration(TestCase):
+    def test_unique_handles(self):
+        registry = _ContainerFieldRegistry()
+        containers = [create_ioc_container(ThreadParameters) for _ in xrange(200)]
+
+        def register(index):
+            for container in containers[index::8]:
+                registry.add(container)
+
+        _run_in_threads(8, register)
+
+        handles = [registry.get(container, name) for container in containers for name in ('first', 'second')]
+        self.assertEqual(range(len(handles)), sorted(handles))
+
+
+class TestInjectionInThreads(TestCase):
+    def test_each_thread_sees_its_own_payload(self):
+        results = {}
+
+        def work(index):
+            with THREAD_CONTAINER.arm(ThreadParameters(index, index)):
+                results[index] = [_sum() for _ in xrange(100)]
+
+        _run_in_threads(16, work)
+        self.assertEqual({index: [2 * index] * 100 for index in xrange(16)}, results)
+
+    def test_missing_in_fresh_thread(self):
+        errors = []
+
+        def work(_):
+            with THREAD_CONTAINER.arm(ThreadParameters(1, 2)):
+                pass
+            try:
+                _sum()
+            except Exception as e:
+                errors.append(e)
+
+        _run_in_threads(1, work)
+        self.assertEqual(1, len(errors))
+        self.assertIsInstance(errors[0], NoValuesProvided)
+
+
+@attr.attrs
+class LateParameters(object):
+    late = attr.attrib()
+
+
+class TestRegistrationAfterThreadStart(TestCase):
+    def test_threads_started_earlier_see_placeholders(self):
+        results = []
+        registered = threading.Event()
+
+        def worker():
+            get_fast_retrieval_context().resources  # Sized before the container below is registered
+            registered.wait()
+            results.append(_late_optional())
+            try:
+                _late_mandatory()
+            except NoValuesProvided:
+                results.append('raised')
+            except IndexError as e:
+                results.append(e)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        late_container = create_ioc_container(LateParameters)
+
+        @inject(late_container)
+        def _late_optional(late=injected_if_available('default')):
+            return late
+
+        @inject(late_container)
+        def _late_mandatory(late=INJECTED):
+            return late
+
+        registered.set()
+        thread.join()
+        self.assertEqual(['default', 'raised'], results)
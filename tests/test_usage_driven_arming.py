@@ -0,0 +1,86 @@
+from unittest import TestCase
+
+import attr
+
+from roro_ioc import create_ioc_container, create_schema_ioc_container, inject, INJECTED, arm_all, \
+    NoValuesProvided, SEQUENCE_PAYLOAD
+from roro_ioc.container_field_registry import get_fast_retrieval_context, get_fast_retrieval_resource_handle
+
+
+@attr.attrs
+class WideContext(object):
+    used = attr.attrib()
+    later = attr.attrib()
+    later_in_arm_all = attr.attrib(default=4)
+    never = attr.attrib(default=5)
+
+
+WIDE_CONTAINER = create_ioc_container(WideContext, arm_used_resources_only=True)
+SEQUENCE_CONTAINER = create_schema_ioc_container(('first', 'second', 'third'), payload_kind=SEQUENCE_PAYLOAD,
+                                                 arm_used_resources_only=True)
+FULL_CONTAINER = create_ioc_container(WideContext)
+
+
+@inject(WIDE_CONTAINER)
+def _used(used=INJECTED):
+    return used
+
+
+@inject(SEQUENCE_CONTAINER)
+def _third(third=INJECTED):
+    return third
+
+
+def _slot(ioc_container, resource_name):
+    context = get_fast_retrieval_context()
+    return context.resources[get_fast_retrieval_resource_handle(ioc_container, resource_name)]
+
+
+def _define_later():
+    @inject(WIDE_CONTAINER)
+    def later(later=INJECTED):
+        return later
+
+    return later
+
+
+def _define_later_in_arm_all():
+    @inject(WIDE_CONTAINER)
+    def later(later_in_arm_all=INJECTED):
+        return later_in_arm_all
+
+    return later
+
+
+class TestUsageDrivenArming(TestCase):
+    def test_unused_resources(self):
+        self.assertIn('never', WIDE_CONTAINER.unused_resources)
+        self.assertNotIn('used', WIDE_CONTAINER.unused_resources)
+        self.assertEqual(frozenset(['first', 'second']), SEQUENCE_CONTAINER.unused_resources)
+
+    def test_only_used_slots_are_armed(self):
+        context = get_fast_retrieval_context()
+        with WIDE_CONTAINER.arm(WideContext(1, 2)):
+            self.assertEqual(1, _used())
+            self.assertIs(context, _slot(WIDE_CONTAINER, 'never'))
+        self.assertIs(context, _slot(WIDE_CONTAINER, 'used'))
+        with SEQUENCE_CONTAINER.arm((1, 2, 3)):
+            self.assertEqual(3, _third())
+            self.assertIs(context, _slot(SEQUENCE_CONTAINER, 'first'))
+
+    def test_other_containers_arm_everything(self):
+        with FULL_CONTAINER.arm(WideContext(1, 2)):
+            self.assertEqual(5, _slot(FULL_CONTAINER, 'never'))
+
+    def test_decorated_while_armed(self):
+        context = get_fast_retrieval_context()
+        for (arm, define, expected, resource_name) in (
+                (WIDE_CONTAINER.arm, _define_later, 2, 'later'),
+                (lambda payload: arm_all({WIDE_CONTAINER: payload}), _define_later_in_arm_all, 4, 'later_in_arm_all')):
+            with arm(WideContext(1, 2)):
+                self.assertEqual(expected, define()())
+            self.assertIs(context, _slot(WIDE_CONTAINER, resource_name))
+            with self.assertRaises(NoValuesProvided):
+                define()()
+            with arm(WideContext(1, 2)):
+                self.assertEqual(expected, define()())
@@ -0,0 +1,135 @@
+import threading
+from unittest import TestCase
+from urllib2 import urlopen
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+import attr
+
+from roro_ioc import create_ioc_container, inject, INJECTED
+from roro_ioc.payload_pool import PooledPayloadFactory
+from roro_ioc.wsgi import ArmingMiddleware, ARM_LATENCY_ENVIRON_KEY
+
+
+@attr.attrs
+class RequestContext(object):
+    path = attr.attrib()
+    tenant = attr.attrib(default='default')
+
+
+@attr.attrs
+class ValidatedRequestContext(object):
+    user_agent = attr.attrib(validator=attr.validators.instance_of(str))
+
+
+@attr.attrs
+class PostInitRequestContext(object):
+    path = attr.attrib()
+    parts = attr.attrib(default=None)
+
+    def __attrs_post_init__(self):
+        self.parts = self.path.split('/')
+
+
+@attr.attrs(init=False)
+class HandWrittenInitRequestContext(object):
+    path = attr.attrib()
+
+    def __init__(self, path):
+        self.path = path.lower()
+
+
+REQUEST_CONTAINER = create_ioc_container(RequestContext)
+VALIDATED_REQUEST_CONTAINER = create_ioc_container(ValidatedRequestContext)
+
+
+@inject(REQUEST_CONTAINER, VALIDATED_REQUEST_CONTAINER)
+def _describe(path=INJECTED, tenant=INJECTED, user_agent=INJECTED):
+    return '{} {} {}'.format(path, tenant, user_agent.split('/')[0])
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class TestPooledPayloadFactory(TestCase):
+    def test_recycles_released_payloads(self):
+        factory = PooledPayloadFactory(RequestContext, lambda environ: {'path': environ['PATH_INFO']})
+        self.assertTrue(factory.recyclable)
+
+        first = factory({'PATH_INFO': '/a'})
+        self.assertEqual(RequestContext('/a', 'default'), first)
+        factory.release(first)
+        self.assertIsNone(first.path)
+
+        second = factory({'PATH_INFO': '/b'})
+        self.assertIs(first, second)
+        self.assertEqual(RequestContext('/b', 'default'), second)
+
+    def test_types_with_construction_logic_are_not_recycled(self):
+        factory = PooledPayloadFactory(PostInitRequestContext, lambda environ: {'path': environ})
+        self.assertFalse(factory.recyclable)
+        factory.release(factory('a/b'))
+        self.assertEqual(PostInitRequestContext('c/d'), factory('c/d'))
+        self.assertEqual(['c', 'd'], factory('c/d').parts)
+
+        factory = PooledPayloadFactory(HandWrittenInitRequestContext, lambda environ: {'path': environ})
+        self.assertFalse(factory.recyclable)
+        self.assertEqual('/a', factory('/A').path)
+
+    def test_validated_types_are_not_recycled(self):
+        factory = PooledPayloadFactory(ValidatedRequestContext, lambda environ: {'user_agent': 'x'})
+        self.assertFalse(factory.recyclable)
+
+        first = factory({})
+        factory.release(first)
+        self.assertIsNot(first, factory({}))
+
+
+class TestArmingMiddleware(TestCase):
+    def setUp(self):
+        self.latencies = []
+        self.seen_environ_latencies = []
+
+        def application(environ, start_response):
+            self.seen_environ_latencies.append(environ[ARM_LATENCY_ENVIRON_KEY])
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [_describe()]
+
+        self.request_factory = PooledPayloadFactory(
+            RequestContext, lambda environ: {'path': environ['PATH_INFO'], 'tenant': environ['QUERY_STRING']})
+        middleware = ArmingMiddleware(
+            application,
+            [(REQUEST_CONTAINER, self.request_factory),
+             (VALIDATED_REQUEST_CONTAINER, lambda environ: ValidatedRequestContext(environ['HTTP_USER_AGENT']))],
+            latency_callback=self.latencies.append)
+
+        self.server = make_server('127.0.0.1', 0, middleware, handler_class=_QuietHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _get(self, path):
+        return urlopen('http://127.0.0.1:{}{}'.format(self.server.server_port, path)).read()
+
+    def test_content_length_of_sized_bodies(self):
+        response = urlopen('http://127.0.0.1:{}/first?acme'.format(self.server.server_port))
+        self.assertEqual(str(len('/first acme Python-urllib')), response.info().getheader('Content-Length'))
+        response.read()
+
+    def test_arms_per_request(self):
+        self.assertEqual('/first acme Python-urllib', self._get('/first?acme'))
+        self.assertEqual('/second other Python-urllib', self._get('/second?other'))
+        self.assertEqual(2, len(self.latencies))
+        self.assertEqual(self.latencies, self.seen_environ_latencies)
+        self.assertTrue(all(latency >= 0 for latency in self.latencies))
+
+    def test_payloads_are_released_after_request(self):
+        self._get('/first?acme')
+        self.assertEqual(1, len(self.request_factory._free))
+        self.assertEqual('/second other Python-urllib', self._get('/second?other'))
+        self.assertEqual(1, len(self.request_factory._free))